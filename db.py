@@ -1,20 +1,199 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker   
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+from collections import deque
 import os
+import threading
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
-    raise Exception("DATABASE_URL is not set!") 
+    raise Exception("DATABASE_URL is not set!")
 
-engine = create_engine(DATABASE_URL)
+# Async-Treiber für dieselbe Datenbank (asyncpg bzw. aiosqlite), falls nicht explizit gesetzt
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+# libpq-Parameter aus DATABASE_URL, die asyncpg nicht kennt und ablehnen würde (sslmode wird zu ssl)
+LIBPQ_ONLY_PARAMS = {
+    "application_name", "channel_binding", "connect_timeout", "gssencmode", "keepalives",
+    "keepalives_count", "keepalives_idle", "keepalives_interval", "options", "sslcert",
+    "sslcrl", "sslkey", "sslpassword", "sslrootcert",
+}
+
+# Connection-Pool (pro Worker-Prozess)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Sekunden, die ein Request auf eine freie Verbindung wartet, bevor es einen Fehler gibt
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Verbindungen nach so vielen Sekunden neu aufbauen (Load Balancer / Server kappen alte Verbindungen)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Maximale Laufzeit einer einzelnen Abfrage auf PostgreSQL, 0 = unbegrenzt
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class PoolMetrics:
+    """Zählt Checkouts aus dem Pool: Wartezeit, belegte Verbindungen, Overflow und Timeouts."""
+
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=samples)
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.max_wait_ms = 0.0
+
+    def record(self, wait_ms: float, overflow: bool):
+        with self._lock:
+            self._latencies.append(wait_ms)
+            self.checkouts += 1
+            self.overflow_checkouts += overflow
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            counters = {
+                "checkouts": self.checkouts,
+                "overflow_checkouts": self.overflow_checkouts,
+                "timeouts": self.timeouts,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+            }
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            **counters,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p99": percentile(0.99),
+        }
+
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+class MeteredPool:
+    """Mixin für QueuePools, das die Wartezeit jedes Checkouts in `metrics` festhält."""
+
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record((time.perf_counter() - start) * 1000, self.checkedout() > self.size())
+        return connection
+
+
+class MeteredQueuePool(MeteredPool, QueuePool):
+    metrics = pool_metrics
+
+
+class MeteredAsyncQueuePool(MeteredPool, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+
+def async_database_url(url):
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        return url
+    url = url.set(drivername=f"{url.get_backend_name()}+{driver}")
+    if driver == "asyncpg":
+        # z.B. Heroku-URLs mit ?sslmode=require; asyncpg versteht dieselben Werte als ssl=
+        query = {key: value for key, value in url.query.items() if key not in LIBPQ_ONLY_PARAMS}
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+
+def engine_options(url, asynchronous: bool = False) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-Memory-SQLite braucht eine einzige geteilte Verbindung, kein Pool-Tuning
+        return {}
+
+    options = {
+        "poolclass": MeteredAsyncQueuePool if asynchronous else MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Eigener Pool für die async Routen; beide Pools zusammen bestimmen die Verbindungen pro Worker
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, asynchronous=True))
+# expire_on_commit=False: nach dem Commit keine impliziten (async unmöglichen) Nachlade-Queries
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite prüft Foreign Keys (und ON DELETE CASCADE) nur mit diesem Pragma, pro Verbindung
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", enable_sqlite_foreign_keys)
+
+def maintenance_engine():
+    """
+    Engine für Migrationen und Wartungsjobs: ohne statement_timeout, weil Index-Builds,
+    VALIDATE CONSTRAINT oder Backfills auf großen Tabellen absichtlich lange laufen.
+    Ohne Pool, die Jobs brauchen nur wenige Verbindungen und laufen nicht im Server-Prozess.
+    """
+    url = make_url(DATABASE_URL)
+    connect_args = {}
+    if url.get_backend_name() == "postgresql":
+        # Explizit 0, damit auch ein per ALTER ROLE/DATABASE gesetztes Timeout nicht greift
+        connect_args["options"] = "-c statement_timeout=0"
+    maintenance = create_engine(url, poolclass=NullPool, connect_args=connect_args)
+    if maintenance.dialect.name == "sqlite":
+        event.listen(maintenance, "connect", enable_sqlite_foreign_keys)
+    return maintenance
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
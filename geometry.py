@@ -0,0 +1,177 @@
+import os
+import shapely
+from shapely import STRtree, wkb
+from shapely.geometry import LineString, MultiPolygon, Point, mapping, shape
+from shapely.ops import unary_union
+from utils import cluster_points, cluster_points_by_distance
+
+# Radius der Puffer um besuchte Punkte (30 m in Grad)
+BUFFER_DEG = 30 / 111_111
+# Toleranz der topologieerhaltenden Vereinfachung beim Speichern (0 = aus)
+SIMPLIFY_TOLERANCE_M = float(os.getenv("POLYGON_SIMPLIFY_TOLERANCE_M", "1.0"))
+# Nachkommastellen der gespeicherten Koordinaten (6 ≈ 0.1 m, negativ = aus)
+COORD_PRECISION = int(os.getenv("POLYGON_COORD_PRECISION", "6"))
+
+
+def polygon_parts(geom) -> list:
+    """Zerlegt eine Geometrie in ihre Einzelpolygone."""
+    if geom is None or geom.is_empty:
+        return []
+    if geom.geom_type == "Polygon":
+        return [geom]
+    if geom.geom_type == "MultiPolygon":
+        return list(geom.geoms)
+    if geom.geom_type == "GeometryCollection":
+        return [part for g in geom.geoms for part in polygon_parts(g)]
+    return []
+
+
+def load_geometry(data):
+    """WKB (bytes) -> Shapely-Geometrie oder None."""
+    if not data:
+        return None
+    return wkb.loads(bytes(data))
+
+
+def dump_geometry(geom) -> bytes:
+    return wkb.dumps(geom)
+
+
+def geometry_from_feature_collection(geojson: dict):
+    """Liest eine FeatureCollection aus Polygon-/MultiPolygon-Features inkl. Löchern ein."""
+    polygons = []
+    for f in geojson.get("features", []):
+        polygons.extend(polygon_parts(shape(f["geometry"])))
+    return MultiPolygon(polygons) if polygons else None
+
+
+def feature(geom) -> dict:
+    """Geometrie -> GeoJSON-Feature (Polygon oder MultiPolygon, mit Löchern)."""
+    return {"type": "Feature", "geometry": mapping(geom)}
+
+
+def feature_collection(geom) -> dict:
+    """Geometrie -> FeatureCollection mit einem Polygon-Feature (inkl. Löchern) pro Fläche."""
+    return {
+        "type": "FeatureCollection",
+        "features": [feature(poly) for poly in polygon_parts(geom)]
+    }
+
+
+def vertex_count(geom) -> int:
+    if geom is None:
+        return 0
+    return int(shapely.get_num_coordinates(geom))
+
+
+def simplify_for_storage(geom):
+    """Vereinfacht (Toleranz in Metern) und quantisiert die Koordinaten vor dem Speichern."""
+    if SIMPLIFY_TOLERANCE_M > 0:
+        geom = geom.simplify(SIMPLIFY_TOLERANCE_M / 111_111, preserve_topology=True)
+    if COORD_PRECISION >= 0:
+        geom = shapely.set_precision(geom, 10 ** -COORD_PRECISION)
+    return geom
+
+
+def merge_incremental(existing, additions: list, simplify: bool = False):
+    """
+    Vereinigt neue Flächen mit der bestehenden Geometrie.
+
+    Nur die Teile der bestehenden Geometrie, die die neuen Flächen schneiden
+    (per STRtree gefunden), gehen in die Union ein. Alle anderen Teile werden
+    unverändert übernommen, so dass der Aufwand mit der Größe des Updates wächst
+    und nicht mit der gesamten Historie. Mit simplify=True wird nur der neu
+    berechnete Teil vereinfacht, die übrigen Teile sind es bereits.
+
+    Gibt (neue Geometrie, Anzahl der Zusätze, die bestehende Teile berührt haben,
+    {"vertices_before": ..., "vertices_after": ...}) zurück.
+    """
+    old_parts = polygon_parts(existing)
+    touched = set()
+    connected = 0
+    if old_parts:
+        tree = STRtree(old_parts)
+        addition_idx, part_idx = tree.query(additions, predicate="intersects")
+        touched = set(part_idx.tolist())
+        connected = len(set(addition_idx.tolist()))
+
+    merged = unary_union([*additions, *(old_parts[i] for i in touched)])
+    untouched = [part for i, part in enumerate(old_parts) if i not in touched]
+    untouched_vertices = int(shapely.get_num_coordinates(untouched).sum()) if untouched else 0
+
+    vertices_before = untouched_vertices + vertex_count(merged)
+    if simplify:
+        merged = simplify_for_storage(merged)
+    stats = {"vertices_before": vertices_before, "vertices_after": untouched_vertices + vertex_count(merged)}
+
+    return MultiPolygon([*untouched, *polygon_parts(merged)]), connected, stats
+
+
+def build_visited_area(coords: list, cluster_distance_m: float = 20, resolution: int = 8) -> dict:
+    """
+    Berechnet die komplette besuchte Fläche aus (lon, lat)-Paaren (WKB + Vertex-Statistik).
+    Nimmt und liefert nur einfache Typen, damit es in einem Prozess-Pool laufen kann.
+    """
+    points = [Point(lon, lat) for lon, lat in coords]
+    clusters = cluster_points(points, max_distance_m=cluster_distance_m)
+
+    # Puffer benachbarter Cluster können sich überlappen, daher am Ende nochmal vereinigen
+    merged_clusters = [unary_union([p.buffer(BUFFER_DEG, resolution=resolution) for p in cluster]) for cluster in clusters]
+    combined = unary_union(merged_clusters)
+    simplified = simplify_for_storage(combined)
+    return {
+        "wkb": dump_geometry(simplified),
+        "vertices_before": vertex_count(combined),
+        "vertices_after": vertex_count(simplified),
+    }
+
+
+# Die folgenden Funktionen laufen im Prozess-Pool (geometry_service) und
+# nehmen/liefern deshalb nur WKB, Koordinatenlisten (lon, lat) und Dicts.
+
+def visited_polygons_geojson(coords: list, cluster_distance_m: float = 60) -> dict:
+    """FeatureCollection mit einem Feature pro Cluster der übergebenen Punkte."""
+    points = [Point(lon, lat) for lon, lat in coords]
+    features = []
+    for cluster in cluster_points(points, max_distance_m=cluster_distance_m):
+        merged = unary_union([p.buffer(BUFFER_DEG, resolution=6) for p in cluster])
+        if polygon_parts(merged):
+            features.append(feature(merged))
+    return {"type": "FeatureCollection", "features": features}
+
+
+def extend_area_with_points(existing_wkb, coords: list) -> dict:
+    """Puffert die Punkte und fügt sie inkrementell in die bestehende Fläche ein."""
+    buffers = [Point(lon, lat).buffer(BUFFER_DEG, resolution=3) for lon, lat in coords]
+    combined, connected, stats = merge_incremental(load_geometry(existing_wkb), buffers, simplify=True)
+    return {
+        "wkb": dump_geometry(combined),
+        "buffers": len(buffers),
+        "connected": connected,
+        "parts": len(polygon_parts(combined)),
+        **stats,
+    }
+
+
+def extend_area_with_tracks(existing_wkb, coords: list, cluster_distance_m: float = 20) -> dict:
+    """Verbindet aufeinanderfolgende Punkte zu Linien, puffert sie und fügt sie ein."""
+    points = [Point(lon, lat) for lon, lat in coords]
+    clustered = cluster_points_by_distance(points, max_distance_m=cluster_distance_m)
+    if not clustered:
+        return {"wkb": None, "tracks": 0}
+
+    buffers = [LineString(group).buffer(BUFFER_DEG, resolution=3) for group in clustered]
+    combined, _, stats = merge_incremental(load_geometry(existing_wkb), buffers, simplify=True)
+    return {"wkb": dump_geometry(combined), "tracks": len(buffers), **stats}
+
+
+def reapply_changes(rebuilt_wkb, before_wkb, current_wkb) -> dict:
+    """
+    Übernimmt in eine neu berechnete Fläche, was zwischen before und current dazugekommen
+    ist (z.B. Erweiterungen, die während eines Rebuilds gespeichert wurden).
+    """
+    added = load_geometry(current_wkb)
+    if added is not None and before_wkb:
+        added = added.difference(load_geometry(before_wkb))
+    combined, _, stats = merge_incremental(load_geometry(rebuilt_wkb), polygon_parts(added), simplify=True)
+    return {"wkb": dump_geometry(combined), **stats}
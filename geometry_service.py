@@ -0,0 +1,96 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+
+# Prozesse für die CPU-lastige Shapely-Arbeit
+GEOMETRY_PROCESSES = int(os.getenv("GEOMETRY_PROCESSES", "2"))
+# Maximal so viele Aufgaben dürfen gleichzeitig laufen oder warten, danach gibt es 503
+GEOMETRY_MAX_PENDING = int(os.getenv("GEOMETRY_MAX_PENDING", str(GEOMETRY_PROCESSES * 4)))
+
+
+class GeometryService:
+    """
+    Führt Geometrie-Funktionen in einem Prozess-Pool aus, damit sie nicht um den GIL
+    der Request-Threads konkurrieren. Die Funktionen müssen auf Modulebene definiert
+    sein und nur einfache Typen (WKB, Koordinatenlisten, Dicts) annehmen und liefern.
+    """
+
+    def __init__(self, processes: int = GEOMETRY_PROCESSES, max_pending: int = GEOMETRY_MAX_PENDING):
+        self.processes = processes
+        self.max_pending = max_pending
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn statt fork: der Server-Prozess hat bereits Threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """Verwirft einen kaputten Pool (Worker abgestürzt, z.B. OOM), der nächste Aufruf legt einen neuen an."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn, *args):
+        """Für Request-Handler: wartet asynchron, 503 wenn der Pool ausgelastet ist."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Geometry service is busy, please retry later",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+        pool = self._executor()
+        try:
+            return await asyncio.wrap_future(pool.submit(fn, *args))
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise HTTPException(
+                status_code=503,
+                detail="Geometry worker crashed, please retry later",
+                headers={"Retry-After": "1"}
+            )
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def run_blocking(self, fn, *args):
+        """Für Hintergrundjobs: zählt zur Auslastung, wird aber nie abgewiesen."""
+        with self._lock:
+            self._pending += 1
+        pool = self._executor()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # Der Job schlägt fehl, spätere Jobs bekommen einen neuen Pool
+            self._discard(pool)
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+geometry_service = GeometryService()
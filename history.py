@@ -0,0 +1,68 @@
+import csv
+import io
+import json
+import os
+from db import SessionLocal
+from ingest import naive_utc
+import models as tables
+
+# Zeilen pro DB-Fetch und pro geschriebenem Chunk
+HISTORY_FETCH_SIZE = int(os.getenv("HISTORY_FETCH_SIZE", "1000"))
+
+CSV_COLUMNS = ("id", "latitude", "longitude", "altitude", "timestamp")
+
+
+def stream_location_history(user_id: int, start=None, end=None, fmt: str = "ndjson"):
+    """
+    Generator über die Standort-Historie eines Users als NDJSON- oder CSV-Chunks.
+
+    Nutzt eine eigene Session mit serverseitigem Cursor (yield_per), so dass der
+    Speicherbedarf unabhängig von der Länge der Historie konstant bleibt. Die
+    Session lebt so lange wie die Response, nicht wie der Request-Handler.
+    start/end mit Zeitzone werden wie beim Ingest auf naive UTC umgerechnet.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(
+            tables.UserLocation.id,
+            tables.UserLocation.latitude,
+            tables.UserLocation.longitude,
+            tables.UserLocation.altitude,
+            tables.UserLocation.timestamp
+        ).filter(tables.UserLocation.user_id == user_id)
+        if start is not None:
+            query = query.filter(tables.UserLocation.timestamp >= naive_utc(start))
+        if end is not None:
+            query = query.filter(tables.UserLocation.timestamp < naive_utc(end))
+        query = query.order_by(tables.UserLocation.timestamp, tables.UserLocation.id).yield_per(HISTORY_FETCH_SIZE)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            writer.writerow(CSV_COLUMNS)
+
+        rows_in_buffer = 0
+        for row in query:
+            if writer:
+                writer.writerow([row.id, row.latitude, row.longitude, row.altitude, row.timestamp.isoformat()])
+            else:
+                buffer.write(json.dumps({
+                    "id": row.id,
+                    "latitude": row.latitude,
+                    "longitude": row.longitude,
+                    "altitude": row.altitude,
+                    "timestamp": row.timestamp.isoformat()
+                }))
+                buffer.write("\n")
+
+            rows_in_buffer += 1
+            if rows_in_buffer >= HISTORY_FETCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                rows_in_buffer = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
@@ -0,0 +1,27 @@
+import hashlib
+from fastapi import Request, Response
+
+
+def make_etag(*parts) -> str:
+    """Starker ETag aus den Teilen, die den Inhalt eindeutig bestimmen (z.B. user_id + last_updated)."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """True wenn If-None-Match den aktuellen ETag enthält."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def cache_headers(etag: str) -> dict:
+    # no-cache: der Client darf speichern, muss aber per If-None-Match nachfragen
+    return {"ETag": etag, "Cache-Control": "no-cache"}
@@ -0,0 +1,133 @@
+import csv
+import io
+import os
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+import models as tables
+
+# "auto" nutzt COPY auf PostgreSQL (psycopg2) und sonst executemany
+LOCATION_INGEST_MODE = os.getenv("LOCATION_INGEST_MODE", "auto")
+LOCATION_INSERT_CHUNK_SIZE = int(os.getenv("LOCATION_INSERT_CHUNK_SIZE", "5000"))
+# User pro Upsert in user_last_location; 5 Parameter pro Zeile, deutlich unter den
+# Limits von SQLite (32766) und PostgreSQL (65535)
+LAST_LOCATION_CHUNK_SIZE = int(os.getenv("LAST_LOCATION_CHUNK_SIZE", "1000"))
+
+LOCATION_COLUMNS = ("user_id", "latitude", "longitude", "timestamp")
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Zeitstempel mit Zeitzone -> naive UTC, wie in den DateTime-Spalten (utcnow) üblich."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def missing_user_ids(db: Session, user_ids) -> set:
+    """Prüft alle User-IDs mit einer einzigen Abfrage und gibt die unbekannten zurück."""
+    wanted = set(user_ids)
+    if not wanted:
+        return set()
+    found = {row.id for row in db.query(tables.User.id).filter(tables.User.id.in_(wanted))}
+    return wanted - found
+
+
+def _use_copy(db: Session) -> bool:
+    if LOCATION_INGEST_MODE == "executemany":
+        return False
+    dialect = db.get_bind().dialect
+    supported = dialect.name == "postgresql" and dialect.driver == "psycopg2"
+    if LOCATION_INGEST_MODE == "copy" and not supported:
+        raise RuntimeError("LOCATION_INGEST_MODE=copy requires PostgreSQL with psycopg2")
+    return supported
+
+
+def _copy_rows(db: Session, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row["user_id"], row["latitude"], row["longitude"], row["timestamp"].isoformat()])
+    buffer.seek(0)
+
+    # Läuft auf der Verbindung der Session, damit COPY in derselben Transaktion landet
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {tables.UserLocation.__tablename__} ({', '.join(LOCATION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def newest_per_user(rows) -> list:
+    """Nur den neuesten Punkt pro User (ON CONFLICT darf eine Zeile nicht zweimal treffen)."""
+    newest = {}
+    for row in rows:
+        # Gemischte Eingaben (mit/ohne Zeitzone) lassen sich nur so vergleichen
+        row = {**row, "timestamp": naive_utc(row["timestamp"])}
+        current = newest.get(row["user_id"])
+        if current is None or row["timestamp"] >= current["timestamp"]:
+            newest[row["user_id"]] = row
+    return [
+        {
+            "user_id": row["user_id"],
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "altitude": row.get("altitude"),
+            "timestamp": row["timestamp"]
+        }
+        for row in newest.values()
+    ]
+
+
+def last_location_upsert(dialect_name: str, rows):
+    """
+    INSERT ... ON CONFLICT für user_last_location; überschreibt nur, wenn der Punkt nicht älter ist.
+    Ein Statement mit einer VALUES-Zeile pro User; für große Batches siehe upsert_last_locations.
+    """
+    values = newest_per_user(rows)
+
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    statement = dialect_insert(tables.UserLastLocation).values(values)
+    return statement.on_conflict_do_update(
+        index_elements=[tables.UserLastLocation.user_id],
+        set_={
+            "latitude": statement.excluded.latitude,
+            "longitude": statement.excluded.longitude,
+            "altitude": statement.excluded.altitude,
+            "timestamp": statement.excluded.timestamp
+        },
+        where=statement.excluded.timestamp >= tables.UserLastLocation.timestamp
+    )
+
+
+def insert_locations(db: Session, entries, chunk_size: int = LOCATION_INSERT_CHUNK_SIZE) -> list[int]:
+    """Schreibt Standorte ohne ORM-Objekte in Batches und gibt die Anzahl pro Batch zurück.
+
+    Committet nicht.
+    """
+    rows = [
+        {"user_id": e.user_id, "latitude": e.latitude, "longitude": e.longitude, "timestamp": naive_utc(e.timestamp)}
+        for e in entries
+    ]
+    use_copy = _use_copy(db)
+
+    counts = []
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        if use_copy:
+            _copy_rows(db, chunk)
+        else:
+            db.execute(insert(tables.UserLocation), chunk)
+        counts.append(len(chunk))
+
+    upsert_last_locations(db, rows)
+    return counts
+
+
+def upsert_last_locations(db: Session, rows, chunk_size: int = LAST_LOCATION_CHUNK_SIZE):
+    """Upsert in user_last_location in Teilen, damit das Parameterlimit der Datenbank nicht reißt. Committet nicht."""
+    latest = newest_per_user(rows)
+    dialect_name = db.get_bind().dialect.name
+    for i in range(0, len(latest), chunk_size):
+        db.execute(last_location_upsert(dialect_name, latest[i:i + chunk_size]))
@@ -0,0 +1,80 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Threads, die Jobs abarbeiten (DB-Zugriffe + Warten auf den Geometrie-Service)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# So viele abgeschlossene Jobs bleiben für Statusabfragen im Speicher
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "1000"))
+
+
+class JobQueue:
+    """
+    In-Process-Queue für Hintergrundjobs.
+
+    Jobs mit gleichem Schlüssel (z.B. ("rebuild", user_id)) werden dedupliziert:
+    solange einer wartet oder läuft, liefert submit() diesen Job zurück.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jobs")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+        self._finished = OrderedDict()
+
+    def submit(self, key, fn, *args) -> tuple[dict, bool]:
+        """Reiht fn(*args) ein. Gibt (Job, neu angelegt?) zurück."""
+        with self._lock:
+            if key in self._active:
+                return dict(self._jobs[self._active[key]]), False
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": datetime.utcnow(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self._active[key] = job_id
+            job = dict(self._jobs[job_id])
+
+        self._executor.submit(self._run, key, job_id, fn, args)
+        return job, True
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _run(self, key, job_id, fn, args):
+        self._update(job_id, status="running", started_at=datetime.utcnow())
+        try:
+            result = fn(*args)
+        except Exception as e:
+            self._finish(key, job_id, status="failed", error=str(e))
+        else:
+            self._finish(key, job_id, status="done", result=result)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _finish(self, key, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields, finished_at=datetime.utcnow())
+            self._active.pop(key, None)
+
+            self._finished[job_id] = True
+            while len(self._finished) > MAX_FINISHED_JOBS:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+
+
+job_queue = JobQueue()
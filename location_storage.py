@@ -0,0 +1,296 @@
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, bindparam, delete, func, select, text
+from sqlalchemy.orm import Session
+import models as tables
+
+# Neue Monats-Partitionen so weit im Voraus anlegen (nur PostgreSQL)
+LOCATION_PARTITION_MONTHS_AHEAD = int(os.getenv("LOCATION_PARTITION_MONTHS_AHEAD", "3"))
+# Punkte älter als so viele Tage werden ausgedünnt, 0 = nie (Standard)
+LOCATION_RAW_RETENTION_DAYS = int(os.getenv("LOCATION_RAW_RETENTION_DAYS", "0"))
+# Beim Ausdünnen bleibt pro User und Zeitraster dieser Länge nur der letzte Punkt
+LOCATION_DOWNSAMPLE_MINUTES = int(os.getenv("LOCATION_DOWNSAMPLE_MINUTES", "15"))
+# Punkte älter als so viele Tage werden archiviert und gelöscht, 0 = nie (Standard)
+LOCATION_ARCHIVE_AFTER_DAYS = int(os.getenv("LOCATION_ARCHIVE_AFTER_DAYS", "0"))
+# Verzeichnis für Archivdateien (NDJSON, gzip); leer = Löschen nur mit --delete-without-archive
+LOCATION_ARCHIVE_DIR = os.getenv("LOCATION_ARCHIVE_DIR", "")
+# Größe eines Zeitfensters; jedes Fenster wird in einer eigenen Transaktion bearbeitet
+LOCATION_MAINTENANCE_WINDOW_HOURS = int(os.getenv("LOCATION_MAINTENANCE_WINDOW_HOURS", "24"))
+LOCATION_MAINTENANCE_CHUNK_SIZE = int(os.getenv("LOCATION_MAINTENANCE_CHUNK_SIZE", "10000"))
+
+TABLE = tables.UserLocation.__tablename__
+# Auffang-Partition für Zeitstempel außerhalb der angelegten Monate (siehe Migration 0006)
+DEFAULT_PARTITION = f"{TABLE}_default"
+DOWNSAMPLE_WATERMARK = "user_locations.downsampled_until"
+EPOCH = datetime(1970, 1, 1)
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def floor_to(value: datetime, seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=(value - EPOCH).total_seconds() // seconds * seconds)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.scalar(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+    ), {"table": TABLE}))
+
+
+def partitions(db: Session) -> list:
+    """[(Name, untere Grenze oder None, obere Grenze oder None)] aller Range-Partitionen, ohne DEFAULT."""
+    rows = db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).all()
+
+    def bound(value):
+        return None if value == "MINVALUE" else datetime.fromisoformat(value.strip("'"))
+
+    result = []
+    for name, expression in rows:
+        match = re.match(r"FOR VALUES FROM \((.+)\) TO \((.+)\)", expression)
+        if match:
+            result.append((name, bound(match.group(1)), bound(match.group(2))))
+    return sorted(result, key=lambda p: p[2])
+
+
+def ensure_partitions(db: Session, now: datetime, months_ahead: int = LOCATION_PARTITION_MONTHS_AHEAD) -> list:
+    """Legt die Monats-Partitionen bis months_ahead an, lückenlos ab der höchsten bestehenden Grenze."""
+    existing = partitions(db)
+    month = existing[-1][2] if existing else month_start(now)
+    created = []
+    while month < add_months(month_start(now), months_ahead + 1):
+        following = add_months(month, 1)
+        name = partition_name(month)
+        bounds = f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        in_range = f"\"timestamp\" >= '{month:%Y-%m-%d}' AND \"timestamp\" < '{following:%Y-%m-%d}'"
+
+        if db.scalar(text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range} LIMIT 1")) is None:
+            db.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} {bounds}"))
+        else:
+            # Wartung ist ausgefallen und Punkte dieses Monats liegen in DEFAULT; dann schlägt
+            # CREATE ... PARTITION OF fehl. Also DEFAULT abhängen, umziehen und wieder anhängen
+            # (in einer Transaktion; Inserts warten so lange auf den Lock)
+            db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+            db.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} {bounds}"))
+            db.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+            db.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}"))
+            db.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+        db.commit()
+        created.append(name)
+        month = following
+    return created
+
+
+def _archive_path(label: str, run: datetime) -> str:
+    # Zeitstempel des Laufs im Namen: ein späterer Lauf überschreibt nie ein bestehendes Archiv
+    return os.path.join(LOCATION_ARCHIVE_DIR, f"{TABLE}_{label}_{run:%Y%m%dT%H%M%S}.ndjson.gz")
+
+
+def _write_archive(rows, path: str) -> int:
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        for row in rows:
+            archive.write(json.dumps({
+                "id": row.id,
+                "user_id": row.user_id,
+                "latitude": row.latitude,
+                "longitude": row.longitude,
+                "altitude": row.altitude,
+                "timestamp": row.timestamp.isoformat()
+            }))
+            archive.write("\n")
+            count += 1
+    return count
+
+
+def _window_rows(db: Session, start: datetime, end: datetime):
+    """Punkte im Zeitfenster als Stream (serverseitiger Cursor), nicht als Liste im Speicher."""
+    location = tables.UserLocation
+    return db.execute(
+        select(location.id, location.user_id, location.latitude, location.longitude, location.altitude, location.timestamp)
+        .where(location.timestamp >= start, location.timestamp < end)
+        .execution_options(yield_per=LOCATION_MAINTENANCE_CHUNK_SIZE)
+    )
+
+
+def drop_expired_partitions(db: Session, cutoff: datetime, run: datetime, limit: int) -> list:
+    """Archiviert und entfernt ganze Partitionen, deren Zeitraum komplett vor cutoff liegt."""
+    dropped = []
+    for name, lower, upper in partitions(db):
+        if upper > cutoff or len(dropped) >= limit:
+            break
+        if LOCATION_ARCHIVE_DIR:
+            rows = db.execute(text(f"SELECT * FROM {name}").execution_options(yield_per=LOCATION_MAINTENANCE_CHUNK_SIZE))
+            _write_archive(rows, _archive_path(name, run))
+        # DETACH + DROP statt DELETE: konstante Kosten, kein Bloat, keine Sperre auf den übrigen Partitionen
+        db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        dropped.append(name)
+    return dropped
+
+
+def archive_windows(db: Session, cutoff: datetime, run: datetime, limit: int) -> int:
+    """Archiviert und löscht Punkte vor cutoff fensterweise, beginnend beim ältesten Punkt."""
+    window = timedelta(hours=LOCATION_MAINTENANCE_WINDOW_HOURS)
+    archived = 0
+    for _ in range(limit):
+        oldest = db.scalar(select(func.min(tables.UserLocation.timestamp)))
+        if oldest is None or oldest >= cutoff:
+            break
+        start = oldest
+        end = min(start + window, cutoff)
+
+        if LOCATION_ARCHIVE_DIR:
+            # Erst die Datei vollständig schreiben, dann in derselben Transaktion löschen
+            _write_archive(_window_rows(db, start, end), _archive_path(f"{start:%Y%m%dT%H%M%S}", run))
+        # Über den Zeitbereich statt einer ID-Liste; trifft per Zeitindex nur die passende Partition
+        deleted = db.execute(
+            delete(tables.UserLocation)
+            .where(tables.UserLocation.timestamp >= start, tables.UserLocation.timestamp < end)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        archived += deleted
+    return archived
+
+
+def _downsample_statement(db: Session, bucket_s: int):
+    """Löscht im Fenster [start, end) alle Punkte außer dem letzten pro User und Rasterfeld."""
+    if db.get_bind().dialect.name == "postgresql":
+        bucket = f'floor(extract(epoch FROM "timestamp") / {bucket_s})'
+    else:
+        # SQLite: ganzzahlige Division auf Unix-Sekunden
+        bucket = f"CAST(strftime('%s', \"timestamp\") AS INTEGER) / {bucket_s}"
+    in_window = '"timestamp" >= :start AND "timestamp" < :end'
+    return text(f"""
+        DELETE FROM {TABLE} WHERE {in_window} AND id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, {bucket} ORDER BY "timestamp" DESC, id DESC
+                ) AS position
+                FROM {TABLE} WHERE {in_window}
+            ) ranked
+            WHERE position > 1
+        )
+    """).bindparams(bindparam("start", type_=DateTime()), bindparam("end", type_=DateTime()))
+
+
+def downsample_windows(db: Session, cutoff: datetime, limit: int) -> int:
+    """
+    Dünnt Punkte vor cutoff aus: pro User und LOCATION_DOWNSAMPLE_MINUTES-Raster bleibt der letzte.
+    Der Fortschritt steht in maintenance_state, jeder Lauf macht dort weiter.
+    """
+    state = db.get(tables.MaintenanceState, DOWNSAMPLE_WATERMARK)
+    if state is None:
+        state = tables.MaintenanceState(key=DOWNSAMPLE_WATERMARK, value=None)
+        db.add(state)
+
+    bucket_s = LOCATION_DOWNSAMPLE_MINUTES * 60
+    window = timedelta(hours=LOCATION_MAINTENANCE_WINDOW_HOURS)
+    # Fenstergrenzen auf das Raster legen, sonst würde ein Rasterfeld auf zwei Fenster verteilt
+    cutoff = floor_to(cutoff, bucket_s)
+    removed = 0
+    for _ in range(limit):
+        # Nächster Punkt ab dem Fortschritt; Lücken in den Daten werden so übersprungen
+        next_point = select(func.min(tables.UserLocation.timestamp))
+        if state.value is not None:
+            next_point = next_point.where(tables.UserLocation.timestamp >= state.value)
+        start = db.scalar(next_point)
+        if start is None or start >= cutoff:
+            break
+        start = floor_to(start, bucket_s)
+        end = min(start + window, cutoff)
+
+        # Ein DELETE pro Fenster; die Auswahl läuft in der DB, nicht über eine ID-Liste in Python
+        removed += db.execute(_downsample_statement(db, bucket_s), {"start": start, "end": end}).rowcount
+        state.value = end
+        db.commit()
+    return removed
+
+
+def create_partitions(db: Session, now: datetime = None) -> list:
+    """Legt fehlende Monats-Partitionen an (nur partitioniertes PostgreSQL); löscht nichts."""
+    if not is_partitioned(db):
+        return []
+    return ensure_partitions(db, now or datetime.utcnow())
+
+
+def run_retention(db: Session, now: datetime = None, max_windows: int = 24, delete_without_archive: bool = False) -> dict:
+    """
+    Ein inkrementeller Lauf für Archivierung und Ausdünnung; begrenzt auf max_windows
+    Fenster/Partitionen pro Schritt. Ohne LOCATION_ARCHIVE_DIR wird nur gelöscht,
+    wenn delete_without_archive das ausdrücklich erlaubt.
+    """
+    now = now or datetime.utcnow()
+    result = {"partitions_dropped": [], "archived": 0, "downsampled": 0}
+
+    if LOCATION_ARCHIVE_AFTER_DAYS:
+        if not LOCATION_ARCHIVE_DIR and not delete_without_archive:
+            raise RuntimeError(
+                "LOCATION_ARCHIVE_AFTER_DAYS is set without LOCATION_ARCHIVE_DIR; "
+                "refusing to delete old locations without an archive"
+            )
+        cutoff = now - timedelta(days=LOCATION_ARCHIVE_AFTER_DAYS)
+        if LOCATION_ARCHIVE_DIR:
+            os.makedirs(LOCATION_ARCHIVE_DIR, exist_ok=True)
+        if is_partitioned(db):
+            result["partitions_dropped"] = drop_expired_partitions(db, cutoff, now, max_windows)
+        result["archived"] = archive_windows(db, cutoff, now, max_windows)
+
+    if LOCATION_RAW_RETENTION_DAYS:
+        cutoff = now - timedelta(days=LOCATION_RAW_RETENTION_DAYS)
+        result["downsampled"] = downsample_windows(db, cutoff, max_windows)
+
+    return result
+
+
+if __name__ == "__main__":
+    # Aufruf aus dem Repo-Root, z.B. per Cron:
+    #   python -m location_storage partitions                   (regelmäßig, ohne Nebenwirkungen auf Daten)
+    #   python -m location_storage retention --max-windows 48   (nur wenn Retention konfiguriert ist)
+    from db import maintenance_engine
+
+    parser = argparse.ArgumentParser(description="Partitionen, Archivierung und Ausdünnung für user_locations")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("partitions", help="Fehlende Monats-Partitionen anlegen")
+    retention = commands.add_parser("retention", help="Alte Punkte archivieren/löschen und ausdünnen")
+    retention.add_argument("--max-windows", type=int, default=24, help="Zeitfenster/Partitionen pro Schritt und Lauf")
+    retention.add_argument(
+        "--delete-without-archive", action="store_true",
+        help="Punkte nach LOCATION_ARCHIVE_AFTER_DAYS auch ohne LOCATION_ARCHIVE_DIR endgültig löschen"
+    )
+    args = parser.parse_args()
+
+    # Ohne das statement_timeout der App, Archiv-Abfragen und DETACH dürfen länger dauern
+    session = Session(bind=maintenance_engine())
+    try:
+        if args.command == "partitions":
+            print(json.dumps({"partitions_created": create_partitions(session)}))
+        else:
+            try:
+                result = run_retention(session, max_windows=args.max_windows, delete_without_archive=args.delete_without_archive)
+            except RuntimeError as e:
+                parser.error(str(e))
+            print(json.dumps(result))
+    finally:
+        session.close()
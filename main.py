@@ -1,13 +1,28 @@
 from fastapi import FastAPI
-from db import engine
-import models as tables
+from fastapi.middleware.gzip import GZipMiddleware
+from db import async_engine, engine, MeteredPool
 from routers import users, locations, socials  # <--- importiere deine Router
 
 app = FastAPI()
 
-tables.Base.metadata.create_all(bind=engine)
+# Große Geometrie-Antworten komprimieren (nur wenn der Client gzip akzeptiert)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Schema wird über Alembic gepflegt: `alembic upgrade head` vor dem Start ausführen
 
 # Routen registrieren
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(locations.router, prefix="/locations", tags=["locations"])
 app.include_router(socials.router, prefix="/socials", tags=["socials"])
+
+
+def pool_status(pool) -> dict:
+    if not isinstance(pool, MeteredPool):
+        return {"pool": type(pool).__name__}
+    return pool.metrics.snapshot(pool)
+
+
+@app.get("/metrics/db_pool")
+def db_pool_metrics():
+    """Auslastung der Connection-Pools (sync und async) dieses Worker-Prozesses."""
+    return {"sync": pool_status(engine.pool), "async": pool_status(async_engine.pool)}
@@ -0,0 +1,48 @@
+from logging.config import fileConfig
+from alembic import context
+from db import maintenance_engine
+import models as tables
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = tables.Base.metadata
+# Ohne das statement_timeout der App: CREATE INDEX CONCURRENTLY, VALIDATE und Backfills dauern
+engine = maintenance_engine()
+
+
+def run_migrations_offline():
+    """SQL-Skript statt direkter Ausführung (alembic upgrade head --sql)."""
+    context.configure(
+        url=engine.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=engine.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            # Batch-Migrationen bauen Tabellen neu auf; mit aktiven Foreign Keys
+            # würde das DROP der alten Tabelle per CASCADE Kind-Zeilen löschen
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite kann Spalten nur über Tabellen-Neuaufbau ändern
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,90 @@
+"""Ausgangsschema, wie es bisher create_all beim Start angelegt hat
+
+Bestehende Datenbanken aus dieser Zeit nicht migrieren, sondern mit
+`alembic stamp 0001_baseline` übernehmen.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("disabled", sa.Boolean()),
+        sa.Column("hashed_password", sa.String()),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "user_locations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("latitude", sa.Float(), nullable=False),
+        sa.Column("longitude", sa.Float(), nullable=False),
+        sa.Column("altitude", sa.Float(), nullable=True),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_user_locations_id", "user_locations", ["id"])
+
+    op.create_table(
+        "user_friends",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("friend_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+    )
+    op.create_index("ix_user_friends_id", "user_friends", ["id"])
+
+    op.create_table(
+        "friend_requests",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("receiver_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("status", sa.Enum("pending", "accepted", "declined", name="requeststatus")),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_friend_requests_id", "friend_requests", ["id"])
+
+    op.create_table(
+        "visited_zones",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE")),
+        sa.Column("latitude", sa.Float(), nullable=False),
+        sa.Column("longitude", sa.Float(), nullable=False),
+        sa.Column("radius", sa.Float()),
+        sa.Column("visits", sa.Integer()),
+        sa.Column("first_visited", sa.DateTime()),
+        sa.Column("last_visited", sa.DateTime()),
+    )
+    op.create_index("ix_visited_zones_id", "visited_zones", ["id"])
+
+    op.create_table(
+        "visited_polygons",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE")),
+        sa.Column("geojson", sa.JSON(), nullable=False),
+        sa.Column("last_updated", sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table("visited_polygons")
+    op.drop_table("visited_zones")
+    op.drop_table("friend_requests")
+    sa.Enum(name="requeststatus").drop(op.get_bind(), checkfirst=True)
+    op.drop_table("user_friends")
+    op.drop_table("user_locations")
+    op.drop_table("users")
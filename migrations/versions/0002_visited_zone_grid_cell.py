@@ -0,0 +1,61 @@
+"""Grid-Zelle für visited_zones, inkl. Backfill der bestehenden Zonen
+
+Revision ID: 0002_visited_zone_grid_cell
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+import math
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_visited_zone_grid_cell"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+# Zonen pro Backfill-Runde, damit große Tabellen nicht komplett im Speicher landen
+BACKFILL_CHUNK_SIZE = 10_000
+# Zellgröße und Schlüssel wie spatial.grid_cell zum Stand dieser Revision; bewusst kopiert,
+# damit spätere Änderungen an spatial.py den Backfill nicht nachträglich verändern
+GRID_CELL_DEG = 0.001
+
+
+def grid_cell(lat: float, lon: float) -> str:
+    return f"{math.floor(lat / GRID_CELL_DEG)}:{math.floor(lon / GRID_CELL_DEG)}"
+
+
+def upgrade():
+    op.add_column("visited_zones", sa.Column("grid_cell", sa.String(), nullable=True))
+
+    # Schlüssel in Python berechnen, gleiche Rundung wie beim Schreiben neuer Zonen
+    zones = sa.table(
+        "visited_zones",
+        sa.column("id", sa.Integer()),
+        sa.column("latitude", sa.Float()),
+        sa.column("longitude", sa.Float()),
+        sa.column("grid_cell", sa.String()),
+    )
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(zones.c.id, zones.c.latitude, zones.c.longitude)
+            .where(zones.c.id > last_id, zones.c.grid_cell.is_(None))
+            .order_by(zones.c.id)
+            .limit(BACKFILL_CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            zones.update().where(zones.c.id == sa.bindparam("zone_id")).values(grid_cell=sa.bindparam("cell")),
+            [{"zone_id": row.id, "cell": grid_cell(row.latitude, row.longitude)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    op.create_index("ix_visited_zones_user_cell", "visited_zones", ["user_id", "grid_cell"])
+
+
+def downgrade():
+    op.drop_index("ix_visited_zones_user_cell", table_name="visited_zones")
+    with op.batch_alter_table("visited_zones") as batch:
+        batch.drop_column("grid_cell")
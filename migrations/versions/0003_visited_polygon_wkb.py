@@ -0,0 +1,30 @@
+"""Fläche als WKB speichern, geojson nur noch für Altbestände
+
+Bestehende GeoJSON-Zeilen werden beim ersten Lesen umgewandelt
+(visited_area.load_visited_wkb), hier ist kein Datenumbau nötig.
+
+Revision ID: 0003_visited_polygon_wkb
+Revises: 0002_visited_zone_grid_cell
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_visited_polygon_wkb"
+down_revision = "0002_visited_zone_grid_cell"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("visited_polygons") as batch:
+        batch.add_column(sa.Column("geometry_wkb", sa.LargeBinary(), nullable=True))
+        batch.alter_column("geojson", existing_type=sa.JSON(), nullable=True)
+
+
+def downgrade():
+    # Zeilen, die nur als WKB existieren, lassen sich ohne Shapely nicht zurückschreiben
+    op.execute("DELETE FROM visited_polygons WHERE geojson IS NULL")
+    with op.batch_alter_table("visited_polygons") as batch:
+        batch.alter_column("geojson", existing_type=sa.JSON(), nullable=False)
+        batch.drop_column("geometry_wkb")
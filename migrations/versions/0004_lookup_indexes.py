@@ -0,0 +1,73 @@
+"""Zusammengesetzte Indizes für die häufigen Lookups, Unique-Constraints, Username-Suche
+
+Auf PostgreSQL werden die Indizes mit CONCURRENTLY angelegt, damit Schreibzugriffe
+auf einer laufenden Datenbank nicht blockiert werden.
+
+Revision ID: 0004_lookup_indexes
+Revises: 0003_visited_polygon_wkb
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_lookup_indexes"
+down_revision = "0003_visited_polygon_wkb"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_user_locations_user_timestamp", "user_locations", ["user_id", sa.text('"timestamp" DESC')]),
+    ("ix_user_friends_friend_user", "user_friends", ["friend_id", "user_id"]),
+    ("ix_friend_requests_sender_receiver_status", "friend_requests", ["sender_id", "receiver_id", "status"]),
+    ("ix_friend_requests_receiver_status", "friend_requests", ["receiver_id", "status"]),
+    ("ix_visited_zones_user_id", "visited_zones", ["user_id", "id"]),
+]
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == "postgresql"
+
+    # Doppelte Einträge entfernen, bevor die Unique-Constraints greifen
+    op.execute(
+        "DELETE FROM user_friends WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_friends GROUP BY user_id, friend_id)"
+    )
+    op.execute(
+        "DELETE FROM visited_polygons WHERE user_id IS NOT NULL AND id NOT IN "
+        "(SELECT MAX(id) FROM visited_polygons WHERE user_id IS NOT NULL GROUP BY user_id)"
+    )
+    with op.batch_alter_table("user_friends") as batch:
+        batch.create_unique_constraint("uq_user_friends_pair", ["user_id", "friend_id"])
+    with op.batch_alter_table("visited_polygons") as batch:
+        batch.create_unique_constraint("uq_visited_polygons_user", ["user_id"])
+
+    if postgres:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=postgres)
+
+        if postgres:
+            op.execute(
+                "CREATE INDEX CONCURRENTLY ix_users_username_lower "
+                "ON users (lower(username) text_pattern_ops)"
+            )
+            op.execute(
+                "CREATE INDEX CONCURRENTLY ix_users_username_trgm "
+                "ON users USING gin (lower(username) gin_trgm_ops)"
+            )
+        else:
+            op.create_index("ix_users_username_lower", "users", [sa.text("lower(username)")])
+
+
+def downgrade():
+    op.drop_index("ix_users_username_trgm", table_name="users", if_exists=True)
+    op.drop_index("ix_users_username_lower", table_name="users")
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+
+    with op.batch_alter_table("visited_polygons") as batch:
+        batch.drop_constraint("uq_visited_polygons_user", type_="unique")
+    with op.batch_alter_table("user_friends") as batch:
+        batch.drop_constraint("uq_user_friends_pair", type_="unique")
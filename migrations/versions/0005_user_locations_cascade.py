@@ -0,0 +1,49 @@
+"""ON DELETE CASCADE für user_locations.user_id
+
+Damit löscht ein DELETE auf users alle abhängigen Zeilen in der Datenbank;
+die übrigen Fremdschlüssel auf users hatten CASCADE schon im Ausgangsschema.
+
+Revision ID: 0005_user_locations_cascade
+Revises: 0004_lookup_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_user_locations_cascade"
+down_revision = "0004_lookup_indexes"
+branch_labels = None
+depends_on = None
+
+# Name, den PostgreSQL dem unbenannten Fremdschlüssel aus dem Ausgangsschema gegeben hat
+FK_NAME = "user_locations_user_id_fkey"
+# Für SQLite-Batch-Migrationen: unbenannte Fremdschlüssel bekommen darüber einen Namen
+NAMING_CONVENTION = {"fk": "%(table_name)s_%(column_0_name)s_fkey"}
+
+
+def replace_foreign_key(ondelete):
+    if op.get_bind().dialect.name == "postgresql":
+        # NOT VALID + VALIDATE: kein langer exklusiver Lock auf einer großen Tabelle
+        op.drop_constraint(FK_NAME, "user_locations", type_="foreignkey")
+        op.execute(
+            f"ALTER TABLE user_locations ADD CONSTRAINT {FK_NAME} FOREIGN KEY (user_id) "
+            f"REFERENCES users (id){' ON DELETE ' + ondelete if ondelete else ''} NOT VALID"
+        )
+        op.execute(f"ALTER TABLE user_locations VALIDATE CONSTRAINT {FK_NAME}")
+        return
+
+    with op.batch_alter_table("user_locations", naming_convention=NAMING_CONVENTION) as batch:
+        batch.drop_constraint(FK_NAME, type_="foreignkey")
+        batch.create_foreign_key(FK_NAME, "users", ["user_id"], ["id"], ondelete=ondelete)
+
+    # Der Tabellen-Neuaufbau übernimmt die Sortierrichtung des Index nicht
+    op.drop_index("ix_user_locations_user_timestamp", table_name="user_locations")
+    op.create_index("ix_user_locations_user_timestamp", "user_locations", ["user_id", sa.text('"timestamp" DESC')])
+
+
+def upgrade():
+    replace_foreign_key("CASCADE")
+
+
+def downgrade():
+    replace_foreign_key(None)
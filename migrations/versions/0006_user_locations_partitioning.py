@@ -0,0 +1,147 @@
+"""user_locations nach Zeit partitionieren (PostgreSQL), Zeitindex und maintenance_state
+
+Auf PostgreSQL wird user_locations zur nach "timestamp" monatlich partitionierten
+Tabelle. Der Bestand wird nicht kopiert: die alte Tabelle wird als Partition
+user_locations_legacy (MINVALUE bis Anfang des Folgemonats) angehängt. Alles, was
+dabei die Tabelle scannt (Indizes, CHECK-Constraint), läuft vorher ohne
+exklusiven Lock; die eigentliche Umstellung ist reine Metadaten-Arbeit.
+
+Auf anderen Datenbanken bleibt die Tabelle, wie sie ist (generischer Fallback in
+location_storage.py über den Zeitindex).
+
+Revision ID: 0006_user_locations_partitioning
+Revises: 0005_user_locations_cascade
+Create Date: 2026-10-18
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_user_locations_partitioning"
+down_revision = "0005_user_locations_cascade"
+branch_labels = None
+depends_on = None
+
+# Monats-Partitionen, die direkt angelegt werden; danach übernimmt "python -m location_storage partitions".
+# Datumslogik und Namensschema wie location_storage zum Stand dieser Revision, bewusst kopiert
+PARTITION_MONTHS_AHEAD = 3
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    op.create_table(
+        "maintenance_state",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("value", sa.DateTime(), nullable=True),
+    )
+
+    if op.get_bind().dialect.name != "postgresql":
+        op.create_index("ix_user_locations_timestamp", "user_locations", ["timestamp"])
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_user_locations_legacy_timestamp '
+            'ON user_locations ("timestamp")'
+        )
+        # Der Primärschlüssel einer partitionierten Tabelle muss den Partitionsschlüssel enthalten
+        op.execute(
+            'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS user_locations_legacy_id_timestamp '
+            'ON user_locations (id, "timestamp")'
+        )
+
+    # Über den neuen Zeitindex billig; auch Punkte mit Zeitstempel in der Zukunft gehören in die Altpartition
+    newest = op.get_bind().scalar(sa.text('SELECT max("timestamp") FROM user_locations'))
+    boundary = add_months(month_start(max(datetime.utcnow(), newest or datetime.min)), 1)
+
+    with op.get_context().autocommit_block():
+        # Mit gültigem CHECK prüft ATTACH PARTITION den Bestand nicht noch einmal unter Lock
+        op.execute(
+            f"ALTER TABLE user_locations ADD CONSTRAINT user_locations_legacy_range "
+            f"CHECK (\"timestamp\" < '{boundary:%Y-%m-%d}') NOT VALID"
+        )
+        op.execute("ALTER TABLE user_locations VALIDATE CONSTRAINT user_locations_legacy_range")
+
+    op.execute("ALTER TABLE user_locations RENAME TO user_locations_legacy")
+    op.execute("ALTER INDEX ix_user_locations_id RENAME TO ix_user_locations_legacy_id")
+    op.execute("ALTER INDEX ix_user_locations_user_timestamp RENAME TO ix_user_locations_legacy_user_timestamp")
+    op.execute("ALTER TABLE user_locations_legacy RENAME CONSTRAINT user_locations_user_id_fkey TO user_locations_legacy_user_id_fkey")
+    op.execute(
+        "ALTER TABLE user_locations_legacy DROP CONSTRAINT user_locations_pkey, "
+        "ADD CONSTRAINT user_locations_legacy_pkey PRIMARY KEY USING INDEX user_locations_legacy_id_timestamp"
+    )
+
+    op.execute("""
+        CREATE TABLE user_locations (
+            id INTEGER NOT NULL DEFAULT nextval('user_locations_id_seq'),
+            user_id INTEGER NOT NULL,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            altitude DOUBLE PRECISION,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            CONSTRAINT user_locations_pkey PRIMARY KEY (id, "timestamp"),
+            CONSTRAINT user_locations_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute("ALTER SEQUENCE user_locations_id_seq OWNED BY user_locations.id")
+    # Auf der (noch leeren) Elterntabelle; beim ATTACH werden die gleichwertigen Indizes der Altpartition übernommen
+    op.execute("CREATE INDEX ix_user_locations_id ON user_locations (id)")
+    op.execute('CREATE INDEX ix_user_locations_user_timestamp ON user_locations (user_id, "timestamp" DESC)')
+    op.execute('CREATE INDEX ix_user_locations_timestamp ON user_locations ("timestamp")')
+
+    op.execute(
+        f"ALTER TABLE user_locations ATTACH PARTITION user_locations_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')"
+    )
+    # Auffangbecken für Zeitstempel außerhalb der angelegten Monate; sollte leer bleiben
+    op.execute("CREATE TABLE user_locations_default PARTITION OF user_locations DEFAULT")
+
+    # Lückenlos ab der Grenze der Altpartition; DEFAULT ist noch leer
+    month = boundary
+    while month < add_months(month_start(datetime.utcnow()), PARTITION_MONTHS_AHEAD + 1):
+        following = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE user_locations_p{month:%Y%m} PARTITION OF user_locations "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+
+
+def downgrade():
+    op.drop_table("maintenance_state")
+
+    if op.get_bind().dialect.name != "postgresql":
+        op.drop_index("ix_user_locations_timestamp", table_name="user_locations")
+        return
+
+    # Zurück zur einfachen Tabelle: Daten kopieren, dann die partitionierte Tabelle samt Partitionen entfernen
+    op.execute("ALTER SEQUENCE user_locations_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE user_locations_plain (
+            id INTEGER NOT NULL DEFAULT nextval('user_locations_id_seq') PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            altitude DOUBLE PRECISION,
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        )
+    """)
+    op.execute(
+        'INSERT INTO user_locations_plain (id, user_id, latitude, longitude, altitude, "timestamp") '
+        'SELECT id, user_id, latitude, longitude, altitude, "timestamp" FROM user_locations'
+    )
+    op.execute("DROP TABLE user_locations")
+    op.execute("ALTER TABLE user_locations_plain RENAME TO user_locations")
+    op.execute("ALTER INDEX user_locations_plain_pkey RENAME TO user_locations_pkey")
+    op.execute("ALTER TABLE user_locations RENAME CONSTRAINT user_locations_plain_user_id_fkey TO user_locations_user_id_fkey")
+    op.execute("ALTER SEQUENCE user_locations_id_seq OWNED BY user_locations.id")
+    op.execute("CREATE INDEX ix_user_locations_id ON user_locations (id)")
+    op.execute('CREATE INDEX ix_user_locations_user_timestamp ON user_locations (user_id, "timestamp" DESC)')
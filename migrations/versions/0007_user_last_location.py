@@ -0,0 +1,39 @@
+"""user_last_location: neuester Standort pro User für /last_location
+
+Revision ID: 0007_user_last_location
+Revises: 0006_user_locations_partitioning
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_user_last_location"
+down_revision = "0006_user_locations_partitioning"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "user_last_location",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("latitude", sa.Float(), nullable=False),
+        sa.Column("longitude", sa.Float(), nullable=False),
+        sa.Column("altitude", sa.Float(), nullable=True),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+    )
+
+    # Backfill: je User der neueste Punkt (Fensterfunktion, läuft auf PostgreSQL und SQLite)
+    op.execute("""
+        INSERT INTO user_last_location (user_id, latitude, longitude, altitude, "timestamp")
+        SELECT user_id, latitude, longitude, altitude, "timestamp" FROM (
+            SELECT user_id, latitude, longitude, altitude, "timestamp",
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY "timestamp" DESC, id DESC) AS position
+            FROM user_locations
+        ) ranked
+        WHERE position = 1
+    """)
+
+
+def downgrade():
+    op.drop_table("user_last_location")
@@ -1,5 +1,5 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Float, DateTime, Enum, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import DDL, event, func, Boolean, Column, Integer, String, ForeignKey, Float, DateTime, Enum, JSON, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import backref, relationship
 from db import Base
 from datetime import datetime
 import enum
@@ -13,17 +13,39 @@ class User(Base):
     disabled = Column(Boolean, default=False)
     hashed_password = Column(String)
 
-    locations = relationship("UserLocation", back_populates="user", cascade="all, delete-orphan")
-    friend_requests_sent = relationship("FriendRequest", foreign_keys="[FriendRequest.sender_id]")
-    visited_zones = relationship("VisitedZone", back_populates="user", cascade="all, delete")
-    friend_requests_received = relationship("FriendRequest", foreign_keys="[FriendRequest.receiver_id]")
-    visited_polygon = relationship("VisitedPolygon", back_populates="user", uselist=False)
+    # passive_deletes: beim Löschen eines Users räumt die DB per ON DELETE CASCADE auf,
+    # das ORM lädt die (teils riesigen) Kind-Tabellen dafür nicht
+    locations = relationship("UserLocation", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    friend_requests_sent = relationship("FriendRequest", foreign_keys="[FriendRequest.sender_id]", passive_deletes=True)
+    visited_zones = relationship("VisitedZone", back_populates="user", cascade="all, delete", passive_deletes=True)
+    friend_requests_received = relationship("FriendRequest", foreign_keys="[FriendRequest.receiver_id]", passive_deletes=True)
+    visited_polygon = relationship("VisitedPolygon", back_populates="user", uselist=False, passive_deletes=True)
+
+    __table_args__ = (
+        # Normalisierter Username für Präfix-Suche und Ranking (siehe search.py)
+        Index(
+            "ix_users_username_lower", func.lower(username).label("username_lower"),
+            postgresql_ops={"username_lower": "text_pattern_ops"}
+        ),
+        # Trigram-Index für die Teilstring-Suche in /socials/search, nur PostgreSQL
+        Index(
+            "ix_users_username_trgm", func.lower(username).label("username_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"username_lower": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
+
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
 
 class UserLocation(Base):
     __tablename__ = "user_locations"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
     altitude = Column(Float, nullable=True)
@@ -32,6 +54,23 @@ class UserLocation(Base):
     # Optional: Rückverbindung zum User (nur wenn du sie brauchst)
     user = relationship("User", back_populates="locations")
 
+    __table_args__ = (
+        # /last_location und /history: pro User nach Zeit sortiert
+        Index("ix_user_locations_user_timestamp", user_id, timestamp.desc()),
+        # Retention und Archivierung (location_storage.py) arbeiten über Zeitfenster
+        Index("ix_user_locations_timestamp", timestamp),
+    )
+
+class UserLastLocation(Base):
+    """Neuester Standort pro User, gepflegt per Upsert beim Schreiben (ingest.last_location_upsert)."""
+    __tablename__ = "user_last_location"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    altitude = Column(Float, nullable=True)
+    timestamp = Column(DateTime, nullable=False)
+
 ## Freundes Tabelle
 class UserFriend(Base):
     __tablename__ = "user_friends"
@@ -41,9 +80,16 @@ class UserFriend(Base):
     friend_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
 
     # Optional für Zugriff über ORM
-    user = relationship("User", foreign_keys=[user_id], backref="friends")
+    user = relationship("User", foreign_keys=[user_id], backref=backref("friends", passive_deletes=True))
     friend = relationship("User", foreign_keys=[friend_id])
 
+    __table_args__ = (
+        # Jede Richtung einer Freundschaft nur einmal; deckt auch Lookups über (user_id, friend_id) ab
+        UniqueConstraint("user_id", "friend_id", name="uq_user_friends_pair"),
+        # Rückrichtung (friend_id, user_id), z.B. für die Suche und das Löschen eines Users
+        Index("ix_user_friends_friend_user", "friend_id", "user_id"),
+    )
+
 ## Freundschaftanfragen
 class RequestStatus(str, enum.Enum):
     pending = "pending"
@@ -63,6 +109,12 @@ class FriendRequest(Base):
     sender = relationship("User", foreign_keys=[sender_id])
     receiver = relationship("User", foreign_keys=[receiver_id])
 
+    __table_args__ = (
+        Index("ix_friend_requests_sender_receiver_status", "sender_id", "receiver_id", "status"),
+        # /received_requests und das Löschen eines Users
+        Index("ix_friend_requests_receiver_status", "receiver_id", "status"),
+    )
+
 
 class VisitedZone(Base):
     __tablename__ = "visited_zones"
@@ -75,15 +127,38 @@ class VisitedZone(Base):
     visits = Column(Integer, default=1)
     first_visited = Column(DateTime, default=datetime.utcnow)
     last_visited = Column(DateTime, default=datetime.utcnow)
+    # Grid-Zelle (siehe spatial.grid_cell) für die Umkreissuche
+    grid_cell = Column(String, nullable=True)
 
     user = relationship("User", back_populates="visited_zones")
 
+    __table_args__ = (
+        Index("ix_visited_zones_user_cell", "user_id", "grid_cell"),
+        # Keyset-Pagination in /visited_zones
+        Index("ix_visited_zones_user_id", "user_id", "id"),
+    )
+
 class VisitedPolygon(Base):
     __tablename__ = "visited_polygons"
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
-    geojson = Column(JSON, nullable=False)
+    # Kanonische Fläche als WKB; geojson nur noch für Altbestände, wird sonst beim Lesen erzeugt
+    geometry_wkb = Column(LargeBinary, nullable=True)
+    geojson = Column(JSON, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow)
     
-    user = relationship("User", back_populates="visited_polygon")
\ No newline at end of file
+    user = relationship("User", back_populates="visited_polygon")
+
+    __table_args__ = (
+        # Höchstens eine Fläche pro User
+        UniqueConstraint("user_id", name="uq_visited_polygons_user"),
+    )
+
+
+class MaintenanceState(Base):
+    """Fortschritt der Wartungsjobs (z.B. bis wohin Standorte schon ausgedünnt sind)."""
+    __tablename__ = "maintenance_state"
+
+    key = Column(String, primary_key=True)
+    value = Column(DateTime, nullable=True)
@@ -0,0 +1,52 @@
+import os
+from typing import Optional
+from fastapi import Query
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Beschreibung für die OpenAPI-Doku der paginierten Endpunkte (Breaking Change, siehe CHANGELOG.md)
+PAGINATED_DESCRIPTION = (
+    "Paginiert: Antwort ist `{\"items\": [...], \"next_cursor\": ...}` statt einer Liste, "
+    f"höchstens `limit` Einträge (Standard {DEFAULT_PAGE_SIZE}, maximal {MAX_PAGE_SIZE}). "
+    "Solange `next_cursor` nicht null ist, mit `after_id=<next_cursor>` die nächste Seite laden."
+)
+
+
+class PageParams:
+    """Keyset-Pagination: after_id ist der next_cursor der vorherigen Seite."""
+
+    def __init__(
+        self,
+        after_id: Optional[int] = Query(None, ge=0),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    ):
+        self.after_id = after_id
+        self.limit = limit
+
+
+def paginate(query, id_column, page: PageParams, cursor_of):
+    """
+    Sortiert stabil nach id_column (Primärschlüssel) und liest eine Zeile mehr als nötig,
+    um zu wissen, ob es eine weitere Seite gibt. Gibt (Zeilen, next_cursor oder None) zurück.
+    """
+    if page.after_id is not None:
+        query = query.filter(id_column > page.after_id)
+    rows = query.order_by(id_column).limit(page.limit + 1).all()
+
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
+
+
+async def paginate_async(db, statement, id_column, page: PageParams, cursor_of):
+    """Wie paginate, für select()-Statements auf einer AsyncSession."""
+    if page.after_id is not None:
+        statement = statement.where(id_column > page.after_id)
+    rows = (await db.execute(statement.order_by(id_column).limit(page.limit + 1))).all()
+
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
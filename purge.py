@@ -0,0 +1,52 @@
+import os
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from db import SessionLocal
+import models as tables
+
+# Ab so vielen Standortpunkten wird ein User im Hintergrund in Etappen gelöscht
+USER_PURGE_THRESHOLD = int(os.getenv("USER_PURGE_THRESHOLD", "100000"))
+# Zeilen pro Lösch-Transaktion beim Purge
+USER_PURGE_CHUNK_SIZE = int(os.getenv("USER_PURGE_CHUNK_SIZE", "10000"))
+
+
+def needs_background_purge(db: Session, user_id: int) -> bool:
+    """True, wenn der User mehr als USER_PURGE_THRESHOLD Standortpunkte hat (Zählung bricht danach ab)."""
+    bounded = (
+        select(tables.UserLocation.id)
+        .where(tables.UserLocation.user_id == user_id)
+        .limit(USER_PURGE_THRESHOLD + 1)
+        .subquery()
+    )
+    return db.scalar(select(func.count()).select_from(bounded)) > USER_PURGE_THRESHOLD
+
+
+def delete_in_chunks(db: Session, model, user_id: int) -> int:
+    """Löscht alle Zeilen des Users in Blöcken, jeder Block in einer eigenen kurzen Transaktion."""
+    deleted = 0
+    while True:
+        chunk = select(model.id).where(model.user_id == user_id).limit(USER_PURGE_CHUNK_SIZE).scalar_subquery()
+        count = db.execute(
+            delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        deleted += count
+        if count < USER_PURGE_CHUNK_SIZE:
+            return deleted
+
+
+def purge_user(user_id: int) -> dict:
+    """
+    Hintergrundjob für User mit sehr großer Historie: erst die großen Tabellen in Etappen,
+    dann der User selbst; den Rest (Freunde, Anfragen, Fläche) erledigt ON DELETE CASCADE.
+    """
+    db = SessionLocal()
+    try:
+        locations = delete_in_chunks(db, tables.UserLocation, user_id)
+        zones = delete_in_chunks(db, tables.VisitedZone, user_id)
+        db.execute(delete(tables.User).where(tables.User.id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+    return {"locations_deleted": locations, "zones_deleted": zones}
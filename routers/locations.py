@@ -1,46 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from shapely import Polygon, LineString
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Annotated, List
-from db import get_db
-from hashing import hash_password, verify_password
+from typing import Annotated, List, Literal, Optional
+from db import get_async_db, get_db
 import models as tables
 from typevalidation import AddLocation, BatchVisitedZones, BatchLocations, ZoneInput
 from datetime import datetime
-from utils import is_within_radius, create_buffered_area, meter_to_degree_lat, cluster_points, cluster_points_by_distance
-from shapely.geometry import Point, MultiPoint, mapping
-from shapely.ops import unary_union
-from fastapi.responses import JSONResponse
+from ingest import insert_locations, last_location_upsert, missing_user_ids
+from spatial import apply_zone_batch, find_matching_zone, grid_cell
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from history import stream_location_history
+from geometry import extend_area_with_points, extend_area_with_tracks, visited_polygons_geojson
+from geometry_service import geometry_service
+from http_cache import cache_headers, is_not_modified, make_etag, not_modified
+from jobs import job_queue
+from pagination import PAGINATED_DESCRIPTION, PageParams, paginate
+from tiles import MAX_ZOOM, render_tile, tile_cache
+from visited_area import commit_visited_wkb, load_visited_wkb, rebuild_visited_area, visited_geojson, visited_version
 
 
 router = APIRouter()
 
 db_dependency = Annotated[Session, Depends(get_db)]
+# Für leichte, reine DB-Routen ohne Threadpool
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+page_dependency = Annotated[PageParams, Depends()]
 
 @router.post("/add_location")
-def add_location(location: AddLocation, db: db_dependency):
-    user_exists = db.query(tables.User).filter(tables.User.id == location.user_id).first()
+async def add_location(location: AddLocation, db: async_db_dependency):
+    user_exists = await db.scalar(select(tables.User.id).where(tables.User.id == location.user_id))
     if not user_exists:
         raise HTTPException(status_code=404, detail="User ID not found")
     
     new_location = tables.UserLocation(
         user_id=location.user_id,
         latitude=location.latitude,
-        longitude=location.longitude
+        longitude=location.longitude,
+        timestamp=datetime.utcnow()
     )
     db.add(new_location)
-    db.commit()
-    db.refresh(new_location)
+    # Neuesten Standort in derselben Transaktion mitschreiben
+    await db.execute(last_location_upsert(db.get_bind().dialect.name, [{
+        "user_id": new_location.user_id,
+        "latitude": new_location.latitude,
+        "longitude": new_location.longitude,
+        "timestamp": new_location.timestamp
+    }]))
+    await db.commit()
     return {"message": "Location added", "location_id": new_location.id, "timestamp": new_location.timestamp}
 
 @router.get("/last_location/{user_id}")
-def get_last_location(user_id: int, db: db_dependency):
-    location = (
-        db.query(tables.UserLocation)
-        .filter(tables.UserLocation.user_id == user_id)
-        .order_by(tables.UserLocation.timestamp.desc())
-        .first()
-    )
+async def get_last_location(user_id: int, db: async_db_dependency):
+    # Primärschlüssel-Lookup statt Sortierung über die ganze Historie
+    location = await db.get(tables.UserLastLocation, user_id)
 
     if not location:
         raise HTTPException(status_code=404, detail="No location found for this user")
@@ -53,15 +67,32 @@ def get_last_location(user_id: int, db: db_dependency):
         "timestamp": location.timestamp
     }
 
+@router.get("/history/{user_id}")
+def get_location_history(
+    user_id: int,
+    db: db_dependency,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    format: Literal["ndjson", "csv"] = Query("ndjson")
+):
+    user_exists = db.query(tables.User.id).filter(tables.User.id == user_id).first()
+    if not user_exists:
+        raise HTTPException(status_code=404, detail="User ID not found")
+
+    if format == "csv":
+        return StreamingResponse(
+            stream_location_history(user_id, start, end, "csv"),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="locations_{user_id}.csv"'}
+        )
+    return StreamingResponse(
+        stream_location_history(user_id, start, end, "ndjson"),
+        media_type="application/x-ndjson"
+    )
+
 @router.post("/visited_zone")
 def mark_visited_zone(data: AddLocation, db: db_dependency):
-    existing_zones = db.query(tables.VisitedZone).filter_by(user_id=data.user_id).all()
-
-    matched_zone = None
-    for zone in existing_zones:
-        if is_within_radius(data.latitude, data.longitude, zone.latitude, zone.longitude, zone.radius):
-            matched_zone = zone
-            break
+    matched_zone = find_matching_zone(db, data.user_id, data.latitude, data.longitude)
 
     if matched_zone:
         matched_zone.last_visited = datetime.utcnow()
@@ -70,7 +101,8 @@ def mark_visited_zone(data: AddLocation, db: db_dependency):
         new_zone = tables.VisitedZone(
             user_id=data.user_id,
             latitude=data.latitude,
-            longitude=data.longitude
+            longitude=data.longitude,
+            grid_cell=grid_cell(data.latitude, data.longitude)
         )
         db.add(new_zone)
 
@@ -79,54 +111,50 @@ def mark_visited_zone(data: AddLocation, db: db_dependency):
 
 @router.post("/batch_visited_zones")
 def batch_visited_zones(data: BatchVisitedZones, db: Session = Depends(get_db)):
-    for entry in data.locations:
-        existing_zones = db.query(tables.VisitedZone).filter_by(user_id=entry.user_id).all()
-
-        matched_zone = None
-        for zone in existing_zones:
-            if is_within_radius(entry.latitude, entry.longitude, zone.latitude, zone.longitude, zone.radius):
-                matched_zone = zone
-                break
-
-        if matched_zone:
-            matched_zone.last_visited = entry.timestamp
-            matched_zone.visits += 1
-        else:
-            new_zone = tables.VisitedZone(
-                user_id=entry.user_id,
-                latitude=entry.latitude,
-                longitude=entry.longitude,
-                last_visited=entry.timestamp
-            )
-            db.add(new_zone)
-
+    updated, created = apply_zone_batch(db, data.locations)
     db.commit()
-    return {"message": f"{len(data.locations)} zones processed"}
+    return {
+        "message": f"{len(data.locations)} zones processed",
+        "zones_updated": updated,
+        "zones_created": created
+    }
 
 
 @router.post("/batch_add_locations")
 def batch_add_locations(data: BatchLocations, db: Session = Depends(get_db)):
-    for entry in data.locations:
-        new_loc = tables.UserLocation(
-            user_id=entry.user_id,
-            latitude=entry.latitude,
-            longitude=entry.longitude,
-            timestamp=entry.timestamp
-        )
-        db.add(new_loc)
+    missing = missing_user_ids(db, {entry.user_id for entry in data.locations})
+    if missing:
+        raise HTTPException(status_code=404, detail=f"User ID not found: {sorted(missing)}")
 
+    batch_counts = insert_locations(db, data.locations)
     db.commit()
-    return {"message": f"{len(data.locations)} locations added"}
+    return {
+        "message": f"{len(data.locations)} locations added",
+        "batches": batch_counts
+    }
 
 
 
-@router.get("/visited_zones/{user_id}")
-def get_visited_zones(user_id: int, db: db_dependency):
-    zones = db.query(tables.VisitedZone).filter(
-        tables.VisitedZone.user_id == user_id
-    ).all()
+@router.get("/visited_zones/{user_id}", description=PAGINATED_DESCRIPTION)
+def get_visited_zones(user_id: int, request: Request, db: db_dependency, page: page_dependency):
+    # Billige Aggregation statt Laden aller Zonen, um Änderungen zu erkennen
+    summary = db.query(
+        func.count(tables.VisitedZone.id),
+        func.max(tables.VisitedZone.id),
+        func.sum(tables.VisitedZone.visits),
+        func.max(tables.VisitedZone.last_visited)
+    ).filter(tables.VisitedZone.user_id == user_id).one()
 
-    return [
+    etag = make_etag("visited_zones", user_id, page.after_id, page.limit, *summary)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    zones, next_cursor = paginate(
+        db.query(tables.VisitedZone).filter(tables.VisitedZone.user_id == user_id),
+        tables.VisitedZone.id, page, lambda zone: zone.id
+    )
+
+    items = [
         {
             "latitude": zone.latitude,
             "longitude": zone.longitude,
@@ -136,36 +164,22 @@ def get_visited_zones(user_id: int, db: db_dependency):
         for zone in zones
     ]
 
+    return JSONResponse(content={"items": items, "next_cursor": next_cursor}, headers=cache_headers(etag))
+
 @router.post("/visited_polygons")
-def get_visited_polygons_from_zones(
+async def get_visited_polygons_from_zones(
     zones: List[ZoneInput] = Body(...),
 ):
     if not zones:
         return {"features": []}
 
-    shapely_points = [Point(z.longitude, z.latitude) for z in zones]
-    clusters = cluster_points(shapely_points, max_distance_m=60)
-
-    features = []
-    for cluster in clusters:
-        merged = unary_union([p.buffer(30 / 111_111, resolution=6) for p in cluster])
-        if merged.geom_type == "Polygon":
-            coords = list(merged.exterior.coords)
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[list(c) for c in coords]]
-                }
-            })
-
-    return JSONResponse(content={
-        "type": "FeatureCollection",
-        "features": features
-    })
+    coords = [(z.longitude, z.latitude) for z in zones]
+    geojson = await geometry_service.run(visited_polygons_geojson, coords)
+
+    return JSONResponse(content=geojson)
 
 @router.post("/extend_visited_polygon/{user_id}")
-def extend_visited_polygon(
+async def extend_visited_polygon(
     user_id: int,
     new_zones: List[ZoneInput] = Body(...),
     db: Session = Depends(get_db)
@@ -174,135 +188,83 @@ def extend_visited_polygon(
         raise HTTPException(status_code=400, detail="No new zones provided.")
 
     # Bestehendes Polygon abrufen
-    existing = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
+    existing, existing_wkb = await run_in_threadpool(load_visited_wkb, db, user_id)
 
-    # Neue Punkte in Shapely-Form umwandeln
-    new_points = [Point(z.longitude, z.latitude) for z in new_zones]
-    new_cluster = unary_union([p.buffer(30 / 111_111, resolution=3) for p in new_points])
+    # Neue Punkte puffern und nur mit den berührten Teilen der alten Fläche vereinigen
+    coords = [(z.longitude, z.latitude) for z in new_zones]
+    result = await geometry_service.run(extend_area_with_points, existing_wkb, coords)
 
-    # Wenn noch kein Polygon existiert, wird es neu erstellt
+    await run_in_threadpool(commit_visited_wkb, db, user_id, existing, result["wkb"])
+
+    vertices = {"vertices_before": result["vertices_before"], "vertices_after": result["vertices_after"]}
     if not existing:
-        geojson = {
-            "type": "FeatureCollection",
-            "features": []
-        }
+        return {"message": "New polygon created from scratch.", **vertices}
+    return {"message": "Polygon extended successfully.", **vertices}
 
-        if new_cluster.geom_type == "Polygon":
-            geojson["features"].append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[list(c) for c in new_cluster.exterior.coords]]
-                }
-            })
-
-        db.add(tables.VisitedPolygon(
-            user_id=user_id,
-            geojson=geojson,
-            last_updated=datetime.utcnow()
-        ))
-        db.commit()
-        return {"message": "New polygon created from scratch."}
-
-    # Wenn bereits ein Polygon existiert, erweitere es
-    old_polygons = []
-    for feature in existing.geojson.get("features", []):
-        coords = feature["geometry"]["coordinates"][0]
-        old_polygons.append(Polygon([(c[0], c[1]) for c in coords]))
-
-    combined = unary_union([*old_polygons, new_cluster])
-
-    new_features = []
-    if combined.geom_type == "Polygon":
-        new_features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [[list(c) for c in combined.exterior.coords]]
-            }
-        })
-    elif combined.geom_type == "MultiPolygon":
-        for poly in combined.geoms:
-            new_features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[list(c) for c in poly.exterior.coords]]
-                }
-            })
-
-    existing.geojson = {
-        "type": "FeatureCollection",
-        "features": new_features
-    }
-    existing.last_updated = datetime.utcnow()
-    db.commit()
+@router.get("/stored_polygon/{user_id}")
+def get_stored_polygon(user_id: int, request: Request, db: Session = Depends(get_db)):
+    # Erst nur last_updated laden; bei unverändertem Stand wird die Geometrie gar nicht gelesen
+    version = visited_version(db, user_id)
 
-    return {"message": "Polygon extended successfully."}
+    if version is None:
+        raise HTTPException(status_code=404, detail="No stored polygon found.")
+
+    etag = make_etag("stored_polygon", user_id, version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-@router.get("/stored_polygon/{user_id}")
-def get_stored_polygon(user_id: int, db: Session = Depends(get_db)):
     stored = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
+    return JSONResponse(content=visited_geojson(stored), headers=cache_headers(etag))
+
 
-    if not stored:
+@router.get("/tiles/{user_id}/{z}/{x}/{y}")
+async def get_visited_tile(user_id: int, z: int, x: int, y: int, request: Request, db: Session = Depends(get_db)):
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates.")
+
+    version = await run_in_threadpool(visited_version, db, user_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="No stored polygon found.")
 
-    return JSONResponse(content=stored.geojson)
+    etag = make_etag("tile", user_id, z, x, y, version)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    payload = tile_cache.get(user_id, z, x, y, version)
+    if payload is None:
+        _, data = await run_in_threadpool(load_visited_wkb, db, user_id)
+        payload = await geometry_service.run(render_tile, data, z, x, y)
+        tile_cache.put(user_id, z, x, y, version, payload)
 
+    return JSONResponse(content=payload, headers=cache_headers(etag))
 
-@router.post("/rebuild_visited_polygon/{user_id}")
+
+@router.post("/rebuild_visited_polygon/{user_id}", status_code=202)
 def rebuild_visited_polygon(user_id: int, db: Session = Depends(get_db)):
-    visited_zones = db.query(tables.VisitedZone).filter_by(user_id=user_id).all()
+    has_zones = db.query(tables.VisitedZone.id).filter_by(user_id=user_id).first()
     
-    if not visited_zones:
+    if not has_zones:
         raise HTTPException(status_code=404, detail="Keine Visited Zones gefunden")
 
-    points = [Point(zone.longitude, zone.latitude) for zone in visited_zones]
-    clusters = cluster_points(points, max_distance_m=20)
-
-    features = []
-    for cluster in clusters:
-        buffered = unary_union([p.buffer(30 / 111_111, resolution=8) for p in cluster])
-        if buffered.geom_type == "Polygon":
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[list(c) for c in buffered.exterior.coords]]
-                }
-            })
-        elif buffered.geom_type == "MultiPolygon":
-            for poly in buffered.geoms:
-                features.append({
-                    "type": "Feature",
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": [[list(c) for c in poly.exterior.coords]]
-                    }
-                })
-
-    new_geojson = {
-        "type": "FeatureCollection",
-        "features": features
-    }
+    # Läuft im Hintergrund; pro User gibt es höchstens einen wartenden/laufenden Rebuild
+    job, created = job_queue.submit(("rebuild", user_id), rebuild_visited_area, user_id)
 
-    existing_polygon = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
-    if existing_polygon:
-        existing_polygon.geojson = new_geojson
-        existing_polygon.last_updated = datetime.utcnow()
-    else:
-        db.add(tables.VisitedPolygon(
-            user_id=user_id,
-            geojson=new_geojson,
-            last_updated=datetime.utcnow()
-        ))
+    message = "Neuberechnung wurde eingereiht." if created else "Neuberechnung läuft bereits."
+    return {"message": message, "job_id": job["job_id"], "status": job["status"]}
 
-    db.commit()
-    return {"message": "Polygon wurde vollständig neu berechnet."}
+
+@router.get("/rebuild_visited_polygon/jobs/{job_id}")
+def get_rebuild_job(job_id: str):
+    job = job_queue.get(job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
 
 
 @router.post("/extend_visited_polygon_neuer/{user_id}")
-def extend_visited_polygon(
+async def extend_visited_polygon(
     user_id: int,
     new_zones: List[ZoneInput] = Body(...),
     db: Session = Depends(get_db)
@@ -310,71 +272,25 @@ def extend_visited_polygon(
     if not new_zones:
         raise HTTPException(status_code=400, detail="Keine Punkte erhalten.")
 
-    # Neue Punkte vorbereiten
-    new_points = [Point(z.longitude, z.latitude) for z in new_zones]
-    clustered = cluster_points_by_distance(new_points, max_distance_meters=20)  # Cluster-Grenze nach deinem Gusto
+    existing, existing_wkb = await run_in_threadpool(load_visited_wkb, db, user_id)
 
-    if not clustered:
-        raise HTTPException(status_code=400, detail="Keine gültigen Cluster gefunden.")
-
-    # Alte Polygone laden
-    existing = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
-    old_polys = []
-    if existing:
-        for f in existing.geojson["features"]:
-            coords = f["geometry"]["coordinates"][0]
-            old_polys.append(Polygon(coords))
-
-    # Für jeden Cluster einen LineString + Buffer → kombinieren
-    all_new_buffers = []
-    for group in clustered:
-        if len(group) < 2:
-            continue  # einzelne Punkte skippen (oder als Punkt puffern, je nach Wunsch)
-        line = LineString(group)
-        all_new_buffers.append(line.buffer(30 / 111_111, resolution=3))
-
-    # Falls keine gültigen Linien
-    if not all_new_buffers:
-        return {"message": "Keine ausreichenden Punkte zur Erweiterung."}
-
-    combined = unary_union([*old_polys, *all_new_buffers]) if old_polys else unary_union(all_new_buffers)
-
-    # In GeoJSON umwandeln
-    features = []
-    if combined.geom_type == "Polygon":
-        features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [[list(c) for c in combined.exterior.coords]]
-            }
-        })
-    elif combined.geom_type == "MultiPolygon":
-        for poly in combined.geoms:
-            features.append({
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[list(c) for c in poly.exterior.coords]]
-                }
-            })
+    # Aufeinanderfolgende Punkte clustern, je Cluster einen LineString puffern und einfügen
+    coords = [(z.longitude, z.latitude) for z in new_zones]
+    result = await geometry_service.run(extend_area_with_tracks, existing_wkb, coords)
 
-    if not existing:
-        db.add(tables.VisitedPolygon(
-            user_id=user_id,
-            geojson={"type": "FeatureCollection", "features": features},
-            last_updated=datetime.utcnow()
-        ))
-    else:
-        existing.geojson = {"type": "FeatureCollection", "features": features}
-        existing.last_updated = datetime.utcnow()
+    if result["wkb"] is None:
+        raise HTTPException(status_code=400, detail="Keine gültigen Cluster gefunden.")
 
-    db.commit()
-    return {"message": "Polygon erfolgreich erweitert mit Cluster-Logik."}
+    await run_in_threadpool(commit_visited_wkb, db, user_id, existing, result["wkb"])
+    return {
+        "message": "Polygon erfolgreich erweitert mit Cluster-Logik.",
+        "vertices_before": result["vertices_before"],
+        "vertices_after": result["vertices_after"]
+    }
 
 
 @router.post("/extend_visited_polygon_test2/{user_id}")
-def extend_visited_polygon(
+async def extend_visited_polygon(
     user_id: int,
     new_zones: List[ZoneInput] = Body(...),
     db: Session = Depends(get_db)
@@ -382,69 +298,19 @@ def extend_visited_polygon(
     if not new_zones:
         raise HTTPException(status_code=400, detail="Keine Punkte erhalten.")
 
-    # Neue Punkte → Buffer
-    new_buffers = [Point(z.longitude, z.latitude).buffer(30 / 111_111, resolution=3) for z in new_zones]
-
-    # Bestehende Polygone laden
-    existing = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
-    old_polys = []
-    if existing:
-        for f in existing.geojson["features"]:
-            coords = f["geometry"]["coordinates"][0]
-            old_polys.append(Polygon(coords))
-
-    # Neue Buffers einteilen: connected vs. disconnected
-    connected = []
-    disconnected = []
-    for buffer in new_buffers:
-        if any(buffer.intersects(poly) for poly in old_polys):
-            connected.append(buffer)
-        else:
-            disconnected.append(buffer)
-
-    # Kombinieren: bestehende + verbundene neuen → Union
-    updated_geoms = []
-    if connected or old_polys:
-        combined = unary_union([*old_polys, *connected])
-        if combined.geom_type == "Polygon":
-            updated_geoms = [combined]
-        elif combined.geom_type == "MultiPolygon":
-            updated_geoms = list(combined.geoms)
-    else:
-        updated_geoms = []
-
-    # Nicht-verbundene Buffer einfach anhängen
-    updated_geoms.extend(disconnected)
-
-    # GeoJSON aufbauen
-    features = []
-    for poly in updated_geoms:
-        features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": [[list(c) for c in poly.exterior.coords]]
-            }
-        })
+    # Bestehende Fläche laden und die neuen Buffer einarbeiten
+    existing, existing_wkb = await run_in_threadpool(load_visited_wkb, db, user_id)
 
-    # Speichern
-    if not existing:
-        db.add(tables.VisitedPolygon(
-            user_id=user_id,
-            geojson={"type": "FeatureCollection", "features": features},
-            last_updated=datetime.utcnow()
-        ))
-    else:
-        existing.geojson = {"type": "FeatureCollection", "features": features}
-        existing.last_updated = datetime.utcnow()
+    coords = [(z.longitude, z.latitude) for z in new_zones]
+    result = await geometry_service.run(extend_area_with_points, existing_wkb, coords)
 
-    db.commit()
+    # Speichern
+    await run_in_threadpool(commit_visited_wkb, db, user_id, existing, result["wkb"])
     return {
         "message": "Polygon aktualisiert.",
-        "connected_buffers": len(connected),
-        "new_isolated_buffers": len(disconnected),
-        "total_features": len(features)
+        "connected_buffers": result["connected"],
+        "new_isolated_buffers": result["buffers"] - result["connected"],
+        "total_features": result["parts"],
+        "vertices_before": result["vertices_before"],
+        "vertices_after": result["vertices_after"]
     }
-
-
-
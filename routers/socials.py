@@ -1,91 +1,132 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
-from db import get_db
+from db import get_async_db
 import models as tables
 from typevalidation import FriendRequestInput, AcceptRequestInput
+from pagination import PAGINATED_DESCRIPTION, PageParams, paginate_async
+from search import SEARCH_RESULT_CAP, username_index, username_match
 
 router = APIRouter()
 
-db_dependency = Annotated[Session, Depends(get_db)]
+# Reine DB-Routen: async, damit die Nebenläufigkeit nicht an der Threadpool-Größe hängt
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+page_dependency = Annotated[PageParams, Depends()]
 
 @router.get("/search")
-def search_users(db: db_dependency, query: str = Query(..., min_length=1), self_id: int = Query(...)):
-    users = db.query(tables.User).filter(
-            tables.User.username.ilike(f"%{query}%"),
+async def search_users(
+    db: db_dependency,
+    query: str = Query(..., min_length=1),
+    self_id: int = Query(...),
+    limit: int = Query(20, ge=1, le=SEARCH_RESULT_CAP),
+    offset: int = Query(0, ge=0)
+):
+    condition, rank = username_match(db, query)
+
+    # Ausstehende Friend-Request prüfen (self_id → user.id)
+    request_sent = exists().where(
+        tables.FriendRequest.sender_id == self_id,
+        tables.FriendRequest.receiver_id == tables.User.id,
+        tables.FriendRequest.status == "pending"
+    )
+
+    # Check if user sent self.id a friend request
+    request_received = exists().where(
+        tables.FriendRequest.sender_id == tables.User.id,
+        tables.FriendRequest.receiver_id == self_id,
+        tables.FriendRequest.status == "pending"
+    )
+
+    # Freundschaft prüfen (egal in welche Richtung)
+    already_friends = exists().where(
+        ((tables.UserFriend.user_id == self_id) & (tables.UserFriend.friend_id == tables.User.id)) |
+        ((tables.UserFriend.user_id == tables.User.id) & (tables.UserFriend.friend_id == self_id))
+    )
+
+    # Alles in einer Abfrage statt drei Abfragen pro Treffer
+    users = (await db.execute(
+        select(
+            tables.User.id,
+            tables.User.username,
+            tables.User.disabled,
+            request_sent.label("request_sent"),
+            request_received.label("request_received"),
+            already_friends.label("already_friends")
+        )
+        .where(
+            condition,
             tables.User.id != self_id,
             tables.User.disabled == False
-            ).all()
+        )
+        # Exakte Treffer zuerst, dann Präfix, dann Teilstring
+        .order_by(rank, func.lower(tables.User.username), tables.User.id)
+        .offset(offset)
+        .limit(limit)
+    )).all()
 
     if not users:
         raise HTTPException(status_code=404, detail="No Users found")
-    
-    result = []
-
-    for user in users:
-        # Ausstehende Friend-Request prüfen (self_id → user.id)
-        request_sent = db.query(tables.FriendRequest).filter(
-            tables.FriendRequest.sender_id == self_id,
-            tables.FriendRequest.receiver_id == user.id,
-            tables.FriendRequest.status == "pending"
-        ).first() is not None
-
-        # Check if user sent self.id a friend request
-        request_received = db.query(tables.FriendRequest).filter(
-            tables.FriendRequest.sender_id == user.id,
-            tables.FriendRequest.receiver_id == self_id,
-            tables.FriendRequest.status == "pending"
-        ).first() is not None
-
-        # Freundschaft prüfen (egal in welche Richtung)
-        already_friends = db.query(tables.UserFriend).filter(
-            ((tables.UserFriend.user_id == self_id) & (tables.UserFriend.friend_id == user.id)) |
-            ((tables.UserFriend.user_id == user.id) & (tables.UserFriend.friend_id == self_id))
-        ).first() is not None
 
-        result.append({
+    return [
+        {
             "id": user.id,
             "username": user.username,
             "disabled": user.disabled,
-            "request_sent": request_sent,
-            "request_received": request_received,
-            "already_friends": already_friends
-        })
+            "request_sent": bool(user.request_sent),
+            "request_received": bool(user.request_received),
+            "already_friends": bool(user.already_friends)
+        }
+        for user in users
+    ]
 
-    return result
+@router.get("/autocomplete")
+async def autocomplete_users(
+    db: db_dependency,
+    prefix: str = Query(..., min_length=1),
+    self_id: int = Query(None),
+    limit: int = Query(10, ge=1, le=SEARCH_RESULT_CAP)
+):
+    # Aus dem In-Memory-Index, ohne Friend-Status; für Vorschläge beim Tippen
+    return await username_index.search(db, prefix, limit, exclude_id=self_id)
 
 @router.post("/send_request")
-def send_friend_request(data: FriendRequestInput, db: db_dependency):
+async def send_friend_request(data: FriendRequestInput, db: db_dependency):
     # check if both IDs exist
-    sender = db.query(tables.User).filter(tables.User.id == data.sender_id).first()
-    receiver = db.query(tables.User).filter(tables.User.id == data.receiver_id).first()
+    sender = await db.get(tables.User, data.sender_id)
+    receiver = await db.get(tables.User, data.receiver_id)
 
     if not sender or not receiver:
         raise HTTPException(status_code=404, detail="One or both users not found")
     if sender.id == receiver.id:
         raise HTTPException(status_code=400, detail="Cannot send friend request to yourself")
     
-    # check if a friend request is already pending
-    existing = db.query(tables.FriendRequest).filter(
-        tables.FriendRequest.sender_id == data.sender_id,
-        tables.FriendRequest.receiver_id == data.receiver_id,
-        tables.FriendRequest.status == "pending"
-    ).first()
-
-    existing_other_way_around = db.query(tables.FriendRequest).filter(
-        tables.FriendRequest.sender_id == data.receiver_id,
-        tables.FriendRequest.receiver_id == data.sender_id,
-        tables.FriendRequest.status == "pending"
-    ).first()
+    # check if a friend request is already pending (egal in welche Richtung)
+    existing = await db.scalar(
+        select(tables.FriendRequest.id).where(
+            tables.FriendRequest.status == "pending",
+            (
+                (tables.FriendRequest.sender_id == data.sender_id) &
+                (tables.FriendRequest.receiver_id == data.receiver_id)
+            ) |
+            (
+                (tables.FriendRequest.sender_id == data.receiver_id) &
+                (tables.FriendRequest.receiver_id == data.sender_id)
+            )
+        ).limit(1)
+    )
 
-    if existing or existing_other_way_around:
+    if existing:
         raise HTTPException(status_code=409, detail="Friend request already sent")
     
     # check if already friends
-    already_friends = db.query(tables.UserFriend).filter(
-        tables.UserFriend.user_id == data.sender_id,
-        tables.UserFriend.friend_id == data.receiver_id,
-    ).first()
+    already_friends = await db.scalar(
+        select(tables.UserFriend.id).where(
+            tables.UserFriend.user_id == data.sender_id,
+            tables.UserFriend.friend_id == data.receiver_id,
+        ).limit(1)
+    )
     
     if already_friends:
         raise HTTPException(status_code=409, detail="Already friends")
@@ -96,18 +137,19 @@ def send_friend_request(data: FriendRequestInput, db: db_dependency):
         receiver_id=data.receiver_id
     )
     db.add(friend_request)
-    db.commit()
-    db.refresh(friend_request)
+    await db.commit()
 
     return {"message": "Friend request sent", "request_id": friend_request.id}
 
 @router.post("/accept_request")
-def accept_friend_request(data: AcceptRequestInput, db: db_dependency):
-    friend_request = db.query(tables.FriendRequest).filter(
-        tables.FriendRequest.sender_id == data.sender_user_id,
-        tables.FriendRequest.receiver_id == data.self_user_id,
-        tables.FriendRequest.status == "pending"
-    ).first()
+async def accept_friend_request(data: AcceptRequestInput, db: db_dependency):
+    friend_request = (await db.scalars(
+        select(tables.FriendRequest).where(
+            tables.FriendRequest.sender_id == data.sender_user_id,
+            tables.FriendRequest.receiver_id == data.self_user_id,
+            tables.FriendRequest.status == "pending"
+        ).limit(1)
+    )).first()
 
     if not friend_request:
         raise HTTPException(status_code=404, detail="Friend request not found or already handled")
@@ -115,31 +157,37 @@ def accept_friend_request(data: AcceptRequestInput, db: db_dependency):
     if friend_request.receiver_id != data.self_user_id:
         raise HTTPException(status_code=403, detail="You are not authorized to accept this friend request")
     
-    # Add friendship both ways around
-    db.add_all([
-        tables.UserFriend(user_id=data.self_user_id, friend_id=data.sender_user_id),
-        tables.UserFriend(user_id=data.sender_user_id, friend_id=data.self_user_id)
-    ])
+    # Add friendship both ways around; bei zwei gleichzeitigen Accepts legt nur einer die
+    # Zeilen an (uq_user_friends_pair), der andere läuft ohne Fehler durch
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    await db.execute(
+        dialect_insert(tables.UserFriend).values([
+            {"user_id": data.self_user_id, "friend_id": data.sender_user_id},
+            {"user_id": data.sender_user_id, "friend_id": data.self_user_id}
+        ]).on_conflict_do_nothing(index_elements=[tables.UserFriend.user_id, tables.UserFriend.friend_id])
+    )
 
     friend_request.status = "accepted"
 
-    db.commit()
+    await db.commit()
 
     return {"message": "Friend request accepted"}
 
 @router.post("/deny_request")
-def deny_friend_request(data: AcceptRequestInput, db: db_dependency):
-    friend_request = db.query(tables.FriendRequest).filter(
-        tables.FriendRequest.status == "pending",
-        (
-            (tables.FriendRequest.sender_id == data.sender_user_id) &
-            (tables.FriendRequest.receiver_id == data.self_user_id)
-        ) |
-        (
-            (tables.FriendRequest.sender_id == data.self_user_id) &
-            (tables.FriendRequest.receiver_id == data.sender_user_id)
-        )
-    ).first()
+async def deny_friend_request(data: AcceptRequestInput, db: db_dependency):
+    friend_request = (await db.scalars(
+        select(tables.FriendRequest).where(
+            tables.FriendRequest.status == "pending",
+            (
+                (tables.FriendRequest.sender_id == data.sender_user_id) &
+                (tables.FriendRequest.receiver_id == data.self_user_id)
+            ) |
+            (
+                (tables.FriendRequest.sender_id == data.self_user_id) &
+                (tables.FriendRequest.receiver_id == data.sender_user_id)
+            )
+        ).limit(1)
+    )).first()
 
     if not friend_request:
         raise HTTPException(status_code=404, detail="Friend request not found or already handled")
@@ -149,28 +197,28 @@ def deny_friend_request(data: AcceptRequestInput, db: db_dependency):
     
     # Add friendship both ways around
 
-    db.delete(friend_request)
+    await db.delete(friend_request)
 
-    db.commit()
+    await db.commit()
 
     return {"message": "Friend request denied"}
 
-@router.get("/outgoing_requests/{self_id}")
-def get_outgoing_request(self_id: int, db: db_dependency):
-    requests = (
-        db.query(
+@router.get("/outgoing_requests/{self_id}", description=PAGINATED_DESCRIPTION)
+async def get_outgoing_request(self_id: int, db: db_dependency, page: page_dependency):
+    requests, next_cursor = await paginate_async(
+        db, select(
             tables.FriendRequest,
             tables.User.username.label("receiver_username")
         )
         .join(tables.User, tables.FriendRequest.receiver_id == tables.User.id)
-        .filter(
+        .where(
             tables.FriendRequest.sender_id == self_id,
             tables.FriendRequest.status == "pending"
-        )
-        .all()
+        ),
+        tables.FriendRequest.id, page, lambda req: req.FriendRequest.id
     )
 
-    return [
+    items = [
         {
             "request_id": req.FriendRequest.id,
             "receiver_id": req.FriendRequest.receiver_id,
@@ -181,22 +229,24 @@ def get_outgoing_request(self_id: int, db: db_dependency):
         for req in requests
     ]
 
-@router.get("/received_requests/{self_id}")
-def get_received_request(self_id: int, db: db_dependency):
-    requests = (
-        db.query(
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/received_requests/{self_id}", description=PAGINATED_DESCRIPTION)
+async def get_received_request(self_id: int, db: db_dependency, page: page_dependency):
+    requests, next_cursor = await paginate_async(
+        db, select(
             tables.FriendRequest,
             tables.User.username.label("sender_username")
         )
         .join(tables.User, tables.FriendRequest.sender_id == tables.User.id)
-        .filter(
+        .where(
             tables.FriendRequest.receiver_id == self_id,
             tables.FriendRequest.status == "pending"
-        )
-        .all()
+        ),
+        tables.FriendRequest.id, page, lambda req: req.FriendRequest.id
     )
 
-    return [
+    items = [
         {
             "request_id": req.FriendRequest.id,
             "sender_id": req.FriendRequest.sender_id,
@@ -207,19 +257,21 @@ def get_received_request(self_id: int, db: db_dependency):
         for req in requests
     ]
 
-@router.get("/get_friends/{self_id}")
-def get_friends(self_id: int, db: db_dependency):
-    friends = (
-        db.query(
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/get_friends/{self_id}", description=PAGINATED_DESCRIPTION)
+async def get_friends(self_id: int, db: db_dependency, page: page_dependency):
+    friends, next_cursor = await paginate_async(
+        db, select(
             tables.UserFriend,
             tables.User.username.label("friend_username")
         )
         .join(tables.User, tables.UserFriend.friend_id == tables.User.id)
-        .filter(tables.UserFriend.user_id == self_id)
-        .all()
+        .where(tables.UserFriend.user_id == self_id),
+        tables.UserFriend.id, page, lambda friend: friend.UserFriend.id
     )
 
-    return [
+    items = [
         {
             "friend_id": friend.UserFriend.friend_id,
             "friend_username": friend.friend_username,
@@ -228,3 +280,5 @@ def get_friends(self_id: int, db: db_dependency):
         for friend in friends
     ]
 
+    return {"items": items, "next_cursor": next_cursor}
+
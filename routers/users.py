@@ -1,69 +1,117 @@
-from fastapi import APIRouter, Depends, HTTPException
+import re
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Annotated
-from db import get_db
-from hashing import hash_password, verify_password
+from db import get_async_db, get_db
+from hashing import hash_password_async, verify_and_update
 import models as tables
 from typevalidation import UserBase, LoginUser
+from search import username_index
+from jobs import job_queue
+from purge import needs_background_purge, purge_user
 
 router = APIRouter()
 
 db_dependency = Annotated[Session, Depends(get_db)]
+async_db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+
+# Verletzter Unique-Index (PostgreSQL) bzw. Spalte aus der SQLite-Meldung -> bisherige 400-Meldung
+REGISTRATION_CONFLICTS = {
+    "ix_users_username": "Username already registered",
+    "users.username": "Username already registered",
+    "ix_users_email": "Email already registered",
+    "users.email": "Email already registered",
+}
+
+def violated_constraint(error: IntegrityError):
+    """Name des verletzten Constraints; nicht aus dem Meldungstext, der auch die Werte enthält."""
+    orig = error.orig
+    diag = getattr(orig, "diag", None)
+    if diag is not None:
+        # psycopg2
+        return diag.constraint_name
+    cause = getattr(orig, "__cause__", None)
+    if getattr(cause, "constraint_name", None):
+        # asyncpg (über den SQLAlchemy-Adapter)
+        return cause.constraint_name
+    # SQLite: "UNIQUE constraint failed: users.username"
+    match = re.search(r"UNIQUE constraint failed: ([\w.]+)", str(orig))
+    return match.group(1) if match else None
+
+def registration_conflict(error: IntegrityError) -> Exception:
+    detail = REGISTRATION_CONFLICTS.get(violated_constraint(error))
+    if detail:
+        return HTTPException(status_code=400, detail=detail)
+    return error
 
 @router.post("/register")
-def create_user(user: UserBase, db: db_dependency):
-    existing_user = db.query(tables.User).filter(tables.User.username == user.username).first()
-    existing_email = db.query(tables.User).filter(tables.User.email == user.email).first()
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Username already registered")
-    if existing_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = hash_password(user.password)
-    new_user = tables.User(username=user.username, email=user.email, disabled=user.disabled, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return {"message": "User created successfully", "user": new_user.username, "user_id": new_user.id}
+async def create_user(user: UserBase, db: async_db_dependency):
+    # Hashen vor dem ersten DB-Zugriff, damit währenddessen keine Verbindung belegt ist
+    hashed_password = await hash_password_async(user.password)
+
+    # Ein INSERT ... RETURNING; Duplikate meldet der Unique-Index statt vorheriger SELECTs
+    try:
+        user_id = await db.scalar(
+            insert(tables.User)
+            .values(username=user.username, email=user.email, disabled=user.disabled, hashed_password=hashed_password)
+            .returning(tables.User.id)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise registration_conflict(e)
+
+    if not user.disabled:
+        username_index.add(user_id, user.username)
+    return {"message": "User created successfully", "user": user.username, "user_id": user_id}
 
 @router.post("/login")
-def login(user: LoginUser, db: db_dependency):
-    db_user = db.query(tables.User).filter(tables.User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+async def login(user: LoginUser, db: async_db_dependency):
+    db_user = (await db.scalars(select(tables.User).where(tables.User.username == user.username))).first()
+    if not db_user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+
+    # Läuft im eigenen Hashing-Pool, nicht im Event-Loop oder Request-Threadpool
+    valid, new_hash = await verify_and_update(user.password, db_user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # Alter Hash (anderes Schema oder geringere Kosten): transparent ersetzen
+        db_user.hashed_password = new_hash
+        await db.commit()
     return {"message": "Login successful", "user": db_user.username , "user_id": db_user.id}
 
 @router.delete("/full_delete/{user_id}")
-def full_delete_user(user_id: int, db: db_dependency):
-    user = db.query(tables.User).filter(tables.User.id == user_id).first()
-    if not user:
+def full_delete_user(user_id: int, response: Response, db: db_dependency):
+    username = db.scalar(select(tables.User.username).where(tables.User.id == user_id))
+    if username is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # 1. Standortdaten löschen
-    db.query(tables.UserLocation).filter(tables.UserLocation.user_id == user_id).delete()
-
-    # 2. Friend Requests löschen (gesendet oder empfangen)
-    db.query(tables.FriendRequest).filter(
-        (tables.FriendRequest.sender_id == user_id) | 
-        (tables.FriendRequest.receiver_id == user_id)
-    ).delete()
-
-    # 3. Freundschaften löschen (egal ob user_id sender oder empfänger)
-    db.query(tables.UserFriend).filter(
-        (tables.UserFriend.user_id == user_id) | 
-        (tables.UserFriend.friend_id == user_id)
-    ).delete()
-
-    # 4. Besuchte Zonen löschen
-    db.query(tables.VisitedZone).filter(tables.VisitedZone.user_id == user_id).delete()
+    if needs_background_purge(db, user_id):
+        # Sehr große Historie: User sofort ausblenden, Daten in Etappen im Hintergrund löschen
+        db.execute(update(tables.User).where(tables.User.id == user_id).values(disabled=True))
+        db.commit()
+        username_index.remove(user_id)
 
-    # 5. Berechnete Polygone löschen
-    db.query(tables.VisitedPolygon).filter(tables.VisitedPolygon.user_id == user_id).delete()
+        job, created = job_queue.submit(("purge", user_id), purge_user, user_id)
+        response.status_code = 202
+        return {"message": f"User {username} is being deleted.", "job_id": job["job_id"], "status": job["status"]}
 
-    # 6. User löschen
-    db.delete(user)
+    # Ein DELETE; Standorte, Zonen, Fläche, Freunde und Anfragen entfernt die DB per ON DELETE CASCADE
+    db.execute(delete(tables.User).where(tables.User.id == user_id))
     db.commit()
+    username_index.remove(user_id)
 
-    return {"message": f"User {user.username} and all related data deleted."}
+    return {"message": f"User {username} and all related data deleted."}
 
+@router.get("/full_delete/jobs/{job_id}")
+def get_purge_job(job_id: str):
+    job = job_queue.get(job_id)
 
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
 
+    return job
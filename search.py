@@ -0,0 +1,156 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import models as tables
+
+# Obergrenze für Treffer pro Suchanfrage
+SEARCH_RESULT_CAP = int(os.getenv("SEARCH_RESULT_CAP", "50"))
+# Nach so vielen Sekunden wird der Autocomplete-Cache komplett neu geladen,
+# damit auch Änderungen aus anderen Worker-Prozessen ankommen
+USERNAME_INDEX_TTL_S = float(os.getenv("USERNAME_INDEX_TTL_S", "300"))
+
+
+def normalize_username(value: str) -> str:
+    return value.strip().lower()
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def username_match(db: AsyncSession, query: str):
+    """
+    Gibt (Filter, Rang) für die Suche nach Usernamen zurück.
+
+    Gesucht wird auf lower(username) (Expression-Index). Rang: 0 = exakter Treffer,
+    1 = Präfix, 2 = Teilstring. Teilstrings gibt es nur auf PostgreSQL, wo der
+    Trigram-Index sie abdeckt; sonst bleibt es bei der indexfähigen Präfix-Suche.
+    """
+    normalized = normalize_username(query)
+    pattern = escape_like(normalized)
+    lowered = func.lower(tables.User.username)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # LIKE 'q%' nutzt den Index mit text_pattern_ops
+        prefix = lowered.like(f"{pattern}%", escape="\\")
+        condition = lowered.like(f"%{pattern}%", escape="\\")
+    else:
+        # SQLite & Co. nutzen für LIKE keinen binären Index, ein Bereich schon
+        prefix = (lowered >= normalized) & (lowered < normalized + chr(0x10FFFF))
+        condition = prefix
+
+    rank = case(
+        (lowered == normalized, 0),
+        (prefix, 1),
+        else_=2
+    )
+    return condition, rank
+
+
+class UsernameIndex:
+    """
+    Sortiertes Array aller aktiven Usernamen (normalisiert) für schnelles Autocomplete.
+
+    Wird beim ersten Zugriff aus der DB geladen und danach bei /users/register und
+    /users/full_delete inkrementell gepflegt. Nach Ablauf der TTL lädt genau ein
+    Request neu, alle anderen bekommen so lange den bisherigen Stand.
+    """
+
+    def __init__(self, ttl_s: float = USERNAME_INDEX_TTL_S):
+        self.ttl_s = ttl_s
+        self._entries = []
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        # Es läuft höchstens ein Reload gleichzeitig
+        self._reload_lock = asyncio.Lock()
+        # add/remove während eines laufenden Reloads; werden auf den neuen Stand nachgezogen
+        self._reloads = 0
+        self._changes = []
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s
+
+    async def _refresh(self, db: AsyncSession):
+        if not self._stale():
+            return
+        if self._loaded_at is not None and self._reload_lock.locked():
+            # Ein anderer Request lädt gerade neu, bis dahin gilt der bisherige Stand
+            return
+        async with self._reload_lock:
+            # Wer auf den ersten Load gewartet hat, findet ihn hier fertig vor
+            if self._stale():
+                await self._load(db)
+
+    async def _load(self, db: AsyncSession):
+        with self._lock:
+            self._reloads += 1
+            since = len(self._changes)
+        try:
+            rows = (await db.execute(
+                select(tables.User.id, tables.User.username).where(tables.User.disabled == False)
+            )).all()
+        except BaseException:
+            with self._lock:
+                self._finish_reload()
+            raise
+
+        keys = {row.id: (normalize_username(row.username), row.username, row.id) for row in rows}
+        with self._lock:
+            # Was seit Beginn des Reloads registriert/gelöscht wurde, fehlt evtl. im gelesenen Stand
+            for user_id, entry in self._changes[since:]:
+                if entry is None:
+                    keys.pop(user_id, None)
+                else:
+                    keys[user_id] = entry
+            self._finish_reload()
+            self._keys = keys
+            self._entries = sorted(keys.values())
+            self._loaded_at = time.monotonic()
+
+    def _finish_reload(self):
+        self._reloads -= 1
+        if self._reloads == 0:
+            self._changes.clear()
+
+    async def search(self, db: AsyncSession, prefix: str, limit: int, exclude_id: int = None) -> list:
+        await self._refresh(db)
+
+        normalized = normalize_username(prefix)
+        with self._lock:
+            result = []
+            start = bisect.bisect_left(self._entries, (normalized,))
+            for key, username, user_id in self._entries[start:]:
+                if not key.startswith(normalized) or len(result) >= limit:
+                    break
+                if user_id != exclude_id:
+                    result.append({"id": user_id, "username": username})
+            return result
+
+    def add(self, user_id: int, username: str):
+        with self._lock:
+            entry = (normalize_username(username), username, user_id)
+            if self._reloads:
+                self._changes.append((user_id, entry))
+            if self._loaded_at is None:
+                return
+            self._keys[user_id] = entry
+            bisect.insort(self._entries, entry)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            if self._reloads:
+                self._changes.append((user_id, None))
+            entry = self._keys.pop(user_id, None)
+            if entry is None:
+                return
+            i = bisect.bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+
+username_index = UsernameIndex()
@@ -0,0 +1,190 @@
+import math
+from collections import defaultdict
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+import models as tables
+from utils import first_within_radius
+
+# Kantenlänge einer Grid-Zelle in Grad (~111 m in Nord-Süd-Richtung)
+GRID_CELL_DEG = 0.001
+# Größter Zonenradius, der beim Matching berücksichtigt wird
+MAX_ZONE_RADIUS_M = 50.0
+# Ab so vielen Zellen (z.B. nahe der Pole) wird nur noch über die Bounding Box gefiltert
+MAX_LOOKUP_CELLS = 64
+
+METERS_PER_DEG_LAT = 111_320
+
+
+def grid_cell(lat: float, lon: float) -> str:
+    """Schlüssel der Grid-Zelle, in der der Punkt liegt, z.B. "52519:13404"."""
+    return f"{math.floor(lat / GRID_CELL_DEG)}:{math.floor(lon / GRID_CELL_DEG)}"
+
+
+def bounding_box(lat: float, lon: float, radius_m: float):
+    """(min_lat, max_lat, min_lon, max_lon) eines Kreises um den Punkt."""
+    dlat = radius_m / METERS_PER_DEG_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(radius_m / (METERS_PER_DEG_LAT * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def cells_in_box(min_lat: float, max_lat: float, min_lon: float, max_lon: float):
+    """Alle Grid-Zellen, die die Bounding Box schneiden, oder None wenn es zu viele sind."""
+    ys = range(math.floor(min_lat / GRID_CELL_DEG), math.floor(max_lat / GRID_CELL_DEG) + 1)
+    xs = range(math.floor(min_lon / GRID_CELL_DEG), math.floor(max_lon / GRID_CELL_DEG) + 1)
+    if len(ys) * len(xs) > MAX_LOOKUP_CELLS:
+        return None
+    return [f"{y}:{x}" for y in ys for x in xs]
+
+
+def nearby_zones_query(db: Session, user_id: int, lat: float, lon: float, radius_m: float = MAX_ZONE_RADIUS_M):
+    """Query auf die Zonen eines Users, die für einen Punkt überhaupt in Frage kommen."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_m)
+    query = db.query(tables.VisitedZone).filter(tables.VisitedZone.user_id == user_id)
+
+    cells = cells_in_box(min_lat, max_lat, min_lon, max_lon)
+    if cells is not None:
+        # Zonen ohne grid_cell (noch nicht nachgetragen) nur über die Bounding Box filtern
+        query = query.filter(or_(tables.VisitedZone.grid_cell.in_(cells), tables.VisitedZone.grid_cell.is_(None)))
+
+    return query.filter(
+        tables.VisitedZone.latitude.between(min_lat, max_lat),
+        tables.VisitedZone.longitude.between(min_lon, max_lon),
+    ).order_by(tables.VisitedZone.id)
+
+
+def find_matching_zone(db: Session, user_id: int, lat: float, lon: float):
+    """Erste bestehende Zone, in deren Radius der Punkt liegt, sonst None."""
+    candidates = nearby_zones_query(db, user_id, lat, lon).all()
+    hit = first_within_radius(
+        lat, lon,
+        [z.latitude for z in candidates],
+        [z.longitude for z in candidates],
+        [z.radius for z in candidates],
+    )
+    return candidates[hit] if hit is not None else None
+
+
+class ZoneGridIndex:
+    """In-Memory-Grid über Zonen eines Users, damit ein Batch nur einmal laden muss.
+
+    Zonen sind Dicts mit den Spalten von VisitedZone. Neu angelegte Zonen landen
+    ebenfalls im Index, so dass spätere Punkte desselben Batches sie matchen.
+    """
+
+    def __init__(self):
+        self.cells = defaultdict(list)
+        self._seq = 0
+
+    def add(self, zone: dict):
+        # Reihenfolge wie bei der DB-Abfrage: bestehende Zonen nach ID, danach neue
+        zone["_seq"] = self._seq
+        self._seq += 1
+        self.cells[zone["grid_cell"] or grid_cell(zone["latitude"], zone["longitude"])].append(zone)
+
+    def match(self, lat: float, lon: float, radius_m: float = MAX_ZONE_RADIUS_M):
+        cells = cells_in_box(*bounding_box(lat, lon, radius_m))
+        if cells is None:
+            candidates = [zone for zones in self.cells.values() for zone in zones]
+        else:
+            candidates = [zone for cell in cells for zone in self.cells.get(cell, ())]
+
+        candidates.sort(key=lambda z: z["_seq"])
+        hit = first_within_radius(
+            lat, lon,
+            [z["latitude"] for z in candidates],
+            [z["longitude"] for z in candidates],
+            [z["radius"] for z in candidates],
+        )
+        return candidates[hit] if hit is not None else None
+
+
+def load_zone_index(db: Session, user_id: int, points, chunk_size: int = 500) -> ZoneGridIndex:
+    """Lädt einmalig alle Zonen eines Users, die für die gegebenen Punkte relevant sind."""
+    needed = set()
+    load_all = False
+    for lat, lon in points:
+        cells = cells_in_box(*bounding_box(lat, lon, MAX_ZONE_RADIUS_M))
+        if cells is None:
+            load_all = True
+            break
+        needed.update(cells)
+
+    columns = (
+        tables.VisitedZone.id,
+        tables.VisitedZone.latitude,
+        tables.VisitedZone.longitude,
+        tables.VisitedZone.radius,
+        tables.VisitedZone.visits,
+        tables.VisitedZone.grid_cell,
+    )
+    base = db.query(*columns).filter(tables.VisitedZone.user_id == user_id)
+
+    if load_all:
+        rows = base.all()
+    else:
+        needed = sorted(needed)
+        # Zonen ohne grid_cell (noch nicht nachgetragen) immer mitladen
+        rows = base.filter(tables.VisitedZone.grid_cell.is_(None)).all()
+        for i in range(0, len(needed), chunk_size):
+            rows.extend(base.filter(tables.VisitedZone.grid_cell.in_(needed[i:i + chunk_size])).all())
+
+    index = ZoneGridIndex()
+    for row in sorted(rows, key=lambda r: r.id):
+        index.add({
+            "id": row.id,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "radius": row.radius,
+            "visits": row.visits,
+            "grid_cell": row.grid_cell,
+        })
+    return index
+
+
+def apply_zone_batch(db: Session, entries):
+    """Matcht alle Einträge gruppiert pro User und schreibt das Ergebnis gesammelt zurück.
+
+    Gibt (aktualisierte Zonen, neue Zonen) zurück. Committet nicht.
+    """
+    by_user = defaultdict(list)
+    for entry in entries:
+        by_user[entry.user_id].append(entry)
+
+    updates = {}
+    inserts = []
+    for user_id, user_entries in by_user.items():
+        index = load_zone_index(db, user_id, [(e.latitude, e.longitude) for e in user_entries])
+
+        for entry in user_entries:
+            zone = index.match(entry.latitude, entry.longitude)
+            if zone:
+                zone["visits"] += 1
+                zone["last_visited"] = entry.timestamp
+                if "id" in zone:
+                    updates[zone["id"]] = zone
+            else:
+                zone = {
+                    "user_id": user_id,
+                    "latitude": entry.latitude,
+                    "longitude": entry.longitude,
+                    "radius": 5.0,
+                    "visits": 1,
+                    "first_visited": entry.timestamp,
+                    "last_visited": entry.timestamp,
+                    "grid_cell": grid_cell(entry.latitude, entry.longitude),
+                }
+                index.add(zone)
+                inserts.append(zone)
+
+    if updates:
+        db.bulk_update_mappings(tables.VisitedZone, [
+            {"id": z["id"], "visits": z["visits"], "last_visited": z["last_visited"]}
+            for z in updates.values()
+        ])
+    if inserts:
+        db.bulk_insert_mappings(tables.VisitedZone, [
+            {k: v for k, v in z.items() if k != "_seq"} for z in inserts
+        ])
+
+    return len(updates), len(inserts)
@@ -0,0 +1,153 @@
+# Aufruf aus dem Repo-Root: python -m testing.bench_async_routes
+# Gegen Postgres: BENCH_POSTGRES_URL=postgresql://... python -m testing.bench_async_routes
+#
+# Startet die App mit uvicorn in einem eigenen Prozess und vergleicht p50/p99 der
+# async Routen mit sync Nachbauten (alte Variante mit get_db im Threadpool) bei hoher Nebenläufigkeit.
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    os.getenv("BENCH_POSTGRES_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench_async.db"
+)
+
+import httpx
+from typing import Annotated
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+from db import SessionLocal, engine, get_db
+from ingest import last_location_upsert
+import models as tables
+from main import app
+
+PORT = int(os.getenv("BENCH_PORT", "8765"))
+USERS = 200
+FRIENDS_PER_USER = 20
+REQUESTS_PER_RUN = 2000
+CONCURRENCY = (50, 200)
+
+db_dependency = Annotated[Session, Depends(get_db)]
+
+
+# Sync-Varianten der Routen (get_db im Threadpool)
+@app.get("/sync/locations/last_location/{user_id}")
+def sync_last_location(user_id: int, db: db_dependency):
+    # Gleiche Abfrage wie die async Route (Primärschlüssel auf user_last_location),
+    # damit nur sync gegen async verglichen wird
+    location = db.get(tables.UserLastLocation, user_id)
+    if not location:
+        raise HTTPException(status_code=404, detail="No location found for this user")
+    return {"user_id": location.user_id, "latitude": location.latitude, "longitude": location.longitude}
+
+
+@app.get("/sync/socials/get_friends/{self_id}")
+def sync_get_friends(self_id: int, db: db_dependency):
+    friends = (
+        db.query(tables.UserFriend, tables.User.username.label("friend_username"))
+        .join(tables.User, tables.UserFriend.friend_id == tables.User.id)
+        .filter(tables.UserFriend.user_id == self_id)
+        .order_by(tables.UserFriend.id)
+        .limit(101)
+        .all()
+    )
+    return {"items": [{"friend_id": f.UserFriend.friend_id, "friend_username": f.friend_username} for f in friends]}
+
+
+ROUTES = {
+    "last_location": "/locations/last_location/{user_id}",
+    "get_friends": "/socials/get_friends/{user_id}",
+}
+
+
+def seed() -> list:
+    tables.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    prefix = f"bench{random.randint(0, 10**9)}_"
+    users = [tables.User(username=f"{prefix}{i}", email=f"{prefix}{i}@bench", hashed_password="-") for i in range(USERS)]
+    db.add_all(users)
+    db.flush()
+    ids = [user.id for user in users]
+    db.bulk_insert_mappings(tables.UserLocation, [
+        {"user_id": user_id, "latitude": 52.5, "longitude": 13.4} for user_id in ids for _ in range(10)
+    ])
+    db.execute(last_location_upsert(engine.dialect.name, [
+        {"user_id": user_id, "latitude": 52.5, "longitude": 13.4, "timestamp": datetime.utcnow()} for user_id in ids
+    ]))
+    db.bulk_insert_mappings(tables.UserFriend, [
+        {"user_id": user_id, "friend_id": friend_id}
+        for user_id in ids for friend_id in random.sample(ids, FRIENDS_PER_USER) if friend_id != user_id
+    ])
+    db.commit()
+    db.close()
+    return ids
+
+
+async def load(client: httpx.AsyncClient, path: str, user_ids: list, concurrency: int) -> tuple:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path.format(user_id=random.choice(user_ids)))
+                errors += response.status_code >= 500
+            except httpx.TransportError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS_PER_RUN)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], REQUESTS_PER_RUN / elapsed, errors
+
+
+async def run_benchmark(user_ids: list):
+    limits = httpx.Limits(max_connections=max(CONCURRENCY), max_keepalive_connections=max(CONCURRENCY))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=60) as client:
+        print(f"\n{engine.dialect.name}, {REQUESTS_PER_RUN} requests per run")
+        print(f"{'route':>14} | {'conc':>4} | {'mode':>5} | {'p50 ms':>8} | {'p99 ms':>8} | {'req/s':>7} | {'err':>4}")
+        print("-" * 69)
+        for name, path in ROUTES.items():
+            for concurrency in CONCURRENCY:
+                for mode, prefix in (("sync", "/sync"), ("async", "")):
+                    # Aufwärmen (Pools füllen, Autocomplete usw.)
+                    await load(client, prefix + path, user_ids, concurrency)
+                    p50, p99, rps, errors = await load(client, prefix + path, user_ids, concurrency)
+                    print(f"{name:>14} | {concurrency:>4} | {mode:>5} | {p50:>8.1f} | {p99:>8.1f} | {rps:>7.0f} | {errors:>4}")
+
+
+def wait_until_ready(server: subprocess.Popen):
+    for _ in range(100):
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/docs", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("uvicorn did not start")
+
+
+if __name__ == "__main__":
+    user_ids = seed()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "testing.bench_async_routes:app", "--port", str(PORT), "--log-level", "warning", "--timeout-keep-alive", "60"],
+        env=os.environ.copy()
+    )
+    try:
+        wait_until_ready(server)
+        asyncio.run(run_benchmark(user_ids))
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,86 @@
+# Aufruf aus dem Repo-Root: python -m testing.bench_batch_add_locations
+# Optional zusätzlich gegen Postgres: BENCH_POSTGRES_URL=postgresql://... python -m testing.bench_batch_add_locations
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models as tables
+from ingest import insert_locations
+from typevalidation import LocationEntry
+
+BATCH_SIZES = (1_000, 10_000)
+
+
+def make_entries(user_id: int, count: int):
+    start = datetime(2024, 1, 1)
+    return [
+        LocationEntry(
+            user_id=user_id,
+            latitude=52.52 + random.uniform(-0.1, 0.1),
+            longitude=13.405 + random.uniform(-0.1, 0.1),
+            timestamp=start + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def orm_insert(db, entries):
+    # Bisheriger Weg: ein ORM-Objekt pro Eintrag
+    for entry in entries:
+        db.add(tables.UserLocation(
+            user_id=entry.user_id,
+            latitude=entry.latitude,
+            longitude=entry.longitude,
+            timestamp=entry.timestamp
+        ))
+    db.commit()
+
+
+def bulk_insert(db, entries):
+    insert_locations(db, entries)
+    db.commit()
+
+
+def run_benchmark(url: str):
+    engine = create_engine(url)
+    tables.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    db = Session()
+    user = tables.User(username=f"bench_{random.randint(0, 10**9)}", email=f"{random.randint(0, 10**9)}@bench", hashed_password="-")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    print(f"\n{engine.dialect.name} ({engine.dialect.driver})")
+    print(f"{'points':>8} | {'orm ms':>9} | {'bulk ms':>9} | {'speedup':>7}")
+    print("-" * 44)
+    for count in BATCH_SIZES:
+        entries = make_entries(user_id, count)
+
+        start = time.perf_counter()
+        orm_insert(db, entries)
+        orm_ms = (time.perf_counter() - start) * 1000
+        db.expunge_all()
+
+        start = time.perf_counter()
+        bulk_insert(db, entries)
+        bulk_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{count:>8} | {orm_ms:>9.1f} | {bulk_ms:>9.1f} | {orm_ms / bulk_ms:>6.1f}x")
+
+    db.query(tables.UserLocation).filter(tables.UserLocation.user_id == user_id).delete()
+    db.query(tables.User).filter(tables.User.id == user_id).delete()
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    run_benchmark("sqlite://")
+    if os.getenv("BENCH_POSTGRES_URL"):
+        run_benchmark(os.environ["BENCH_POSTGRES_URL"])
@@ -0,0 +1,62 @@
+# Aufruf aus dem Repo-Root: python -m testing.bench_cluster_points
+import random
+import time
+from geopy.distance import geodesic
+from shapely.geometry import Point
+from utils import cluster_points
+
+POINT_COUNTS = (1_000, 10_000, 100_000)
+# Bis zu dieser Größe wird auch der alte quadratische Clusterer gemessen
+MAX_REFERENCE_POINTS = 1_000
+
+
+def reference_cluster_points(points, max_distance_m=10):
+    # Bisherige Implementierung (O(n²), geodesic)
+    clusters = []
+    for point in points:
+        added = False
+        for cluster in clusters:
+            if any(geodesic((point.y, point.x), (other.y, other.x)).meters <= max_distance_m for other in cluster):
+                cluster.append(point)
+                added = True
+                break
+        if not added:
+            clusters.append([point])
+    return clusters
+
+
+def random_walk(count: int):
+    # Zusammenhängende Spuren wie bei echten Nutzern, mit gelegentlichen Sprüngen
+    lat, lon = 52.52, 13.405
+    points = []
+    for _ in range(count):
+        if random.random() < 0.01:
+            lat += random.uniform(-0.05, 0.05)
+            lon += random.uniform(-0.05, 0.05)
+        lat += random.uniform(-0.0002, 0.0002)
+        lon += random.uniform(-0.0002, 0.0002)
+        points.append(Point(lon, lat))
+    return points
+
+
+def run_benchmark(max_distance_m=20):
+    print(f"{'points':>8} | {'reference ms':>12} | {'indexed ms':>10} | {'clusters':>8}")
+    print("-" * 49)
+    for count in POINT_COUNTS:
+        points = random_walk(count)
+
+        reference = "-"
+        if count <= MAX_REFERENCE_POINTS:
+            start = time.perf_counter()
+            reference_cluster_points(points, max_distance_m)
+            reference = f"{(time.perf_counter() - start) * 1000:.1f}"
+
+        start = time.perf_counter()
+        clusters = cluster_points(points, max_distance_m)
+        indexed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{count:>8} | {reference:>12} | {indexed_ms:>10.1f} | {len(clusters):>8}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
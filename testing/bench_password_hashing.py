@@ -0,0 +1,52 @@
+# Aufruf aus dem Repo-Root: python -m testing.bench_password_hashing
+#
+# Logins pro Sekunde und Kern für verschiedene Hash-Schemata und Kosten,
+# dazu der Durchsatz über den Hashing-Pool (hashing.verify_and_update).
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from passlib.context import CryptContext
+import hashing
+
+VERIFICATIONS = 20
+
+CONFIGS = {
+    "bcrypt rounds=10": CryptContext(schemes=["bcrypt"], bcrypt__rounds=10),
+    "bcrypt rounds=12": CryptContext(schemes=["bcrypt"], bcrypt__rounds=12),
+    "argon2 t=2 m=19MiB": CryptContext(schemes=["argon2"], argon2__time_cost=2, argon2__memory_cost=19456, argon2__parallelism=1),
+    "argon2 t=3 m=64MiB": CryptContext(schemes=["argon2"], argon2__time_cost=3, argon2__memory_cost=65536, argon2__parallelism=1),
+}
+
+
+def per_core(context: CryptContext) -> tuple:
+    hashed = context.hash("correct horse battery staple")
+    start = time.perf_counter()
+    for _ in range(VERIFICATIONS):
+        context.verify("correct horse battery staple", hashed)
+    elapsed = time.perf_counter() - start
+    return elapsed / VERIFICATIONS * 1000, VERIFICATIONS / elapsed
+
+
+async def through_pool(hashed: str, logins: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(hashing.verify_and_update("correct horse battery staple", hashed) for _ in range(logins)))
+    return logins / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"{'scheme':>20} | {'ms/verify':>9} | {'logins/s/core':>13}")
+    print("-" * 49)
+    for name, context in CONFIGS.items():
+        ms, rate = per_core(context)
+        print(f"{name:>20} | {ms:>9.1f} | {rate:>13.1f}")
+
+    hashed = hashing.hash_password("correct horse battery staple")
+    logins = min(hashing.PASSWORD_HASH_MAX_PENDING, VERIFICATIONS * hashing.PASSWORD_HASH_WORKERS)
+    rate = asyncio.run(through_pool(hashed, logins))
+    print(
+        f"\nhashing pool ({hashing.PASSWORD_HASH_SCHEME}, {hashing.PASSWORD_HASH_WORKERS} workers, "
+        f"{os.cpu_count()} cores): {rate:.1f} logins/s"
+    )
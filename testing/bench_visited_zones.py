@@ -0,0 +1,74 @@
+# Aufruf aus dem Repo-Root: python -m testing.bench_visited_zones
+import os
+import random
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models as tables
+from spatial import find_matching_zone, grid_cell
+from utils import is_within_radius
+
+# Mittelpunkt der zufälligen Zonen (Berlin) und Ausdehnung in Grad
+CENTER_LAT = 52.52
+CENTER_LON = 13.405
+SPREAD_DEG = 0.5
+LOOKUPS = 200
+
+
+def seed_zones(db, user_id: int, count: int):
+    rows = []
+    for _ in range(count):
+        lat = CENTER_LAT + random.uniform(-SPREAD_DEG, SPREAD_DEG)
+        lon = CENTER_LON + random.uniform(-SPREAD_DEG, SPREAD_DEG)
+        rows.append({
+            "user_id": user_id,
+            "latitude": lat,
+            "longitude": lon,
+            "radius": 5.0,
+            "grid_cell": grid_cell(lat, lon),
+        })
+    db.bulk_insert_mappings(tables.VisitedZone, rows)
+    db.commit()
+
+
+def full_scan_lookup(db, user_id: int, lat: float, lon: float):
+    # Bisheriges Verhalten: alle Zonen laden und einzeln prüfen
+    for zone in db.query(tables.VisitedZone).filter_by(user_id=user_id).all():
+        if is_within_radius(lat, lon, zone.latitude, zone.longitude, zone.radius):
+            return zone
+    return None
+
+
+def time_lookups(db, user_id: int, lookup, points):
+    start = time.perf_counter()
+    for lat, lon in points:
+        lookup(db, user_id, lat, lon)
+    return (time.perf_counter() - start) / len(points) * 1000
+
+
+def run_benchmark(zone_counts=(1_000, 10_000, 50_000)):
+    engine = create_engine("sqlite://")
+    tables.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    print(f"{'zones':>8} | {'full scan ms':>12} | {'grid index ms':>13}")
+    print("-" * 40)
+    for user_id, count in enumerate(zone_counts, start=1):
+        db = Session()
+        seed_zones(db, user_id, count)
+        points = [
+            (CENTER_LAT + random.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER_LON + random.uniform(-SPREAD_DEG, SPREAD_DEG))
+            for _ in range(LOOKUPS)
+        ]
+        # Full Scan nur auf einem Teil der Punkte, sonst dauert es zu lange
+        scan_ms = time_lookups(db, user_id, full_scan_lookup, points[:10])
+        grid_ms = time_lookups(db, user_id, find_matching_zone, points)
+        print(f"{count:>8} | {scan_ms:>12.3f} | {grid_ms:>13.3f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,66 @@
+# Aufruf aus dem Repo-Root: python -m testing.check_geometry_service
+# Prüft, dass der Geometrie-Service nach einem abgestürzten Worker (wie bei einem OOM-Kill) weiterarbeitet.
+import asyncio
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from geometry_service import GeometryService
+
+
+def crash():
+    os._exit(1)
+
+
+def square(value: int) -> int:
+    return value * value
+
+
+async def check_run(service: GeometryService) -> list[str]:
+    errors = []
+    try:
+        await service.run(crash)
+        errors.append("run: Absturz des Workers wurde nicht gemeldet")
+    except HTTPException as e:
+        if e.status_code != 503:
+            errors.append(f"run: Status {e.status_code} statt 503")
+
+    try:
+        if await service.run(square, 7) != 49:
+            errors.append("run: falsches Ergebnis nach dem Absturz")
+    except Exception as e:
+        errors.append(f"run: Aufruf nach dem Absturz schlägt fehl ({e!r})")
+    return errors
+
+
+def check_run_blocking(service: GeometryService) -> list[str]:
+    errors = []
+    try:
+        service.run_blocking(crash)
+        errors.append("run_blocking: Absturz des Workers wurde nicht gemeldet")
+    except BrokenProcessPool:
+        pass
+
+    try:
+        if service.run_blocking(square, 7) != 49:
+            errors.append("run_blocking: falsches Ergebnis nach dem Absturz")
+    except Exception as e:
+        errors.append(f"run_blocking: Aufruf nach dem Absturz schlägt fehl ({e!r})")
+    return errors
+
+
+def run() -> int:
+    service = GeometryService(processes=1)
+    try:
+        errors = asyncio.run(check_run(service)) + check_run_blocking(service)
+    finally:
+        service.shutdown()
+
+    for error in errors:
+        print(f"FAILED {error}")
+    print(f"{len(errors)} failures, {service.pending} tasks still pending")
+    return len(errors) + service.pending
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run() else 0)
@@ -0,0 +1,150 @@
+# Aufruf aus dem Repo-Root: python -m testing.explain_queries
+# Gegen Postgres: EXPLAIN_DATABASE_URL=postgresql://... python -m testing.explain_queries
+#
+# Ruft alle Endpoints einmal auf, zeichnet jede SELECT/UPDATE/DELETE-Abfrage auf,
+# die dabei an die Datenbank geht, und lässt sich für jede den Query-Plan geben.
+# Exit-Code 1, sobald eine Abfrage eine Tabelle komplett scannt oder ein Endpoint keinen 2xx-Status liefert.
+import os
+import re
+import sys
+import tempfile
+import time
+
+EXPLAIN_DATABASE_URL = os.getenv("EXPLAIN_DATABASE_URL")
+if not EXPLAIN_DATABASE_URL:
+    EXPLAIN_DATABASE_URL = f"sqlite:///{tempfile.mkdtemp()}/explain.db"
+os.environ["DATABASE_URL"] = EXPLAIN_DATABASE_URL
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from db import async_engine, engine
+import models as tables
+from main import app
+
+# Abfragen, die bewusst eine ganze Tabelle lesen (Teil des SQL-Texts -> Begründung)
+ALLOWED_FULL_SCANS = {
+    "FROM users WHERE users.disabled =": "Autocomplete-Index lädt alle aktiven Usernamen",
+}
+
+TABLES = set(tables.Base.metadata.tables)
+
+captured = {}
+failed_calls = []
+
+
+def capture(conn, cursor, statement, parameters, context, executemany):
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+        return
+    if context.compiled is not None and conn.dialect.paramstyle != engine.dialect.paramstyle:
+        # Der Async-Treiber (asyncpg) hat einen anderen Parameterstil; EXPLAIN läuft über den sync Treiber
+        compiled = context.compiled.statement.compile(dialect=engine.dialect)
+        statement, parameters = compiled.string, compiled.construct_params(context.compiled_parameters[0])
+    captured.setdefault(statement, parameters)
+
+
+def check_status(response):
+    # Ein Endpoint, der mit einem Fehler abbricht, schickt seine Abfragen gar nicht erst ab
+    if not 200 <= response.status_code < 300:
+        response.read()
+        failed_calls.append(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:200]}")
+
+
+def exercise_endpoints(client: TestClient):
+    for name in ("alice", "bob", "carol"):
+        client.post("/users/register", json={"username": name, "email": f"{name}@example.com", "password": "pw"})
+    client.post("/users/login", json={"username": "alice", "password": "pw"})
+
+    client.post("/locations/add_location", json={"user_id": 1, "latitude": 52.5, "longitude": 13.4})
+    client.get("/locations/last_location/1")
+    client.post("/locations/visited_zone", json={"user_id": 1, "latitude": 52.5, "longitude": 13.4})
+    points = [
+        {"user_id": 1, "latitude": 52.5 + i * 0.0001, "longitude": 13.4, "timestamp": "2024-01-01T00:00:00"}
+        for i in range(20)
+    ]
+    client.post("/locations/batch_visited_zones", json={"locations": points})
+    client.post("/locations/batch_add_locations", json={"locations": points})
+    client.get("/locations/visited_zones/1", params={"limit": 5})
+    client.get("/locations/visited_zones/1", params={"limit": 5, "after_id": 2})
+    client.get("/locations/history/1", params={"start": "2023-01-01T00:00:00"})
+
+    zones = [{"latitude": p["latitude"], "longitude": p["longitude"]} for p in points]
+    client.post("/locations/extend_visited_polygon/1", json=zones)
+    client.post("/locations/extend_visited_polygon_test2/1", json=zones[:5])
+    client.post("/locations/extend_visited_polygon_neuer/1", json=zones)
+    client.get("/locations/stored_polygon/1")
+    client.get("/locations/tiles/1/16/35200/21493")
+
+    job = client.post("/locations/rebuild_visited_polygon/1").json()
+    for _ in range(100):
+        status = client.get(f"/locations/rebuild_visited_polygon/jobs/{job['job_id']}").json()["status"]
+        if status in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    if status != "done":
+        failed_calls.append(f"rebuild job -> {status}")
+
+    client.post("/socials/send_request", json={"sender_id": 1, "receiver_id": 2})
+    client.post("/socials/send_request", json={"sender_id": 3, "receiver_id": 1})
+    client.get("/socials/search", params={"query": "b", "self_id": 1})
+    client.get("/socials/autocomplete", params={"prefix": "b"})
+    client.get("/socials/outgoing_requests/1", params={"after_id": 0})
+    client.get("/socials/received_requests/1")
+    client.post("/socials/accept_request", json={"self_user_id": 2, "sender_user_id": 1})
+    client.post("/socials/deny_request", json={"self_user_id": 1, "sender_user_id": 3})
+    client.get("/socials/get_friends/1")
+
+    client.delete("/users/full_delete/2")
+
+
+def full_scans(connection, statement, parameters) -> list:
+    """Liste der komplett gescannten Tabellen laut Query-Plan."""
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        if connection.dialect.name == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            details = [row[3] for row in cursor.fetchall()]
+            # "SEARCH t USING INDEX ..." ist ein Index-Lookup, "SCAN t" ein kompletter Durchlauf
+            return [m.group(1) for d in details if (m := re.match(r"SCAN (\w+)", d)) and m.group(1) in TABLES]
+
+        # Postgres wählt bei kleinen Tabellen immer Seq Scans; hier interessiert nur, ob ein Indexpfad existiert
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("EXPLAIN " + statement, parameters)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        return re.findall(r"Seq Scan on (\w+)", plan)
+    finally:
+        cursor.close()
+
+
+def run():
+    tables.Base.metadata.create_all(bind=engine)
+    # Sync- und Async-Routen laufen über getrennte Engines
+    engines = (engine, async_engine.sync_engine)
+    for e in engines:
+        event.listen(e, "before_cursor_execute", capture)
+    client = TestClient(app)
+    client.event_hooks = {"request": [], "response": [check_status]}
+    exercise_endpoints(client)
+    for e in engines:
+        event.remove(e, "before_cursor_execute", capture)
+
+    failures = 0
+    with engine.connect() as connection:
+        for statement, parameters in captured.items():
+            normalized = " ".join(statement.split())
+            allowed = next((reason for sql, reason in ALLOWED_FULL_SCANS.items() if sql in normalized), None)
+            scanned = full_scans(connection, statement, parameters)
+            connection.rollback()
+
+            if scanned and not allowed:
+                failures += 1
+                print(f"FULL SCAN on {', '.join(scanned)}:\n    {normalized}\n")
+
+    for call in failed_calls:
+        print(f"FAILED CALL {call}")
+
+    print(f"{len(captured)} queries checked, {failures} with full table scans, {len(failed_calls)} failed calls")
+    return failures + len(failed_calls)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run() else 0)
@@ -0,0 +1,77 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+import shapely
+from geometry import feature_collection, load_geometry
+
+MAX_ZOOM = 22
+# Auflösung eines Tiles in Pixeln; bestimmt Vereinfachung und Koordinatengenauigkeit
+TILE_PIXELS = 256
+# Anzahl gerenderter Tiles im Speicher (pro Prozess)
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "2000"))
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(min_lon, min_lat, max_lon, max_lat) eines Web-Mercator-Tiles (XYZ-Schema)."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def render_tile(existing_wkb, z: int, x: int, y: int) -> dict:
+    """
+    Schneidet die Fläche auf das Tile zu und vereinfacht sie auf etwa ein Pixel.
+    Läuft im Prozess-Pool (geometry_service).
+    """
+    geom = load_geometry(existing_wkb)
+    # Eintrag ohne Fläche (z.B. alter Datensatz ohne Features)
+    if geom is None or geom.is_empty:
+        return feature_collection(None)
+
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    pixel = (max_lon - min_lon) / TILE_PIXELS
+
+    # Etwas Rand, damit an den Tile-Kanten keine sichtbaren Nähte entstehen
+    clipped = shapely.clip_by_rect(geom, min_lon - pixel, min_lat - pixel, max_lon + pixel, max_lat + pixel)
+    if clipped.is_empty:
+        return feature_collection(None)
+
+    clipped = clipped.simplify(pixel / 2, preserve_topology=True)
+    clipped = shapely.set_precision(clipped, pixel / 16)
+    return feature_collection(clipped)
+
+
+class TileCache:
+    """LRU-Cache für gerenderte Tiles. Der Eintrag gilt nur für die Version (last_updated), mit der er erzeugt wurde."""
+
+    def __init__(self, max_size: int = TILE_CACHE_SIZE):
+        self.max_size = max_size
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, z: int, x: int, y: int, version: str):
+        with self._lock:
+            entry = self._tiles.get((user_id, z, x, y))
+            if entry is None or entry[0] != version:
+                return None
+            self._tiles.move_to_end((user_id, z, x, y))
+            return entry[1]
+
+    def put(self, user_id: int, z: int, x: int, y: int, version: str, payload: dict):
+        with self._lock:
+            self._tiles[(user_id, z, x, y)] = (version, payload)
+            self._tiles.move_to_end((user_id, z, x, y))
+            while len(self._tiles) > self.max_size:
+                self._tiles.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in [key for key in self._tiles if key[0] == user_id]:
+                del self._tiles[key]
+
+
+tile_cache = TileCache()
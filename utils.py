@@ -1,19 +1,38 @@
 import math
+import numpy as np
 from shapely.geometry import Point, MultiPoint
 from geopy.distance import geodesic
 
-def is_within_radius(lat1, lon1, lat2, lon2, radius_meters=5):
-    R = 6371000  # Erdradius in Metern
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+EARTH_RADIUS_M = 6371000  # Erdradius in Metern
+
+def distances_to(lat, lon, lats, lons):
+    """
+    Haversine-Distanzen in Metern von einem Punkt zu N Punkten in einer NumPy-Operation.
+    lats/lons: Sequenzen oder Arrays gleicher Länge.
+    """
+    phi1 = math.radians(lat)
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lons, dtype=float)) - math.radians(lon)
 
-    a = math.sin(dphi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    a = np.sin(dphi / 2)**2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
+    a = np.clip(a, 0.0, 1.0)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-    distance = R * c
-    return distance <= radius_meters
+    return EARTH_RADIUS_M * c
+
+def first_within_radius(lat, lon, lats, lons, radii):
+    """
+    Index des ersten Punkts, in dessen Radius (lat, lon) liegt, sonst None.
+    radii: ein Radius für alle oder ein Radius pro Punkt (Meter).
+    """
+    if len(lats) == 0:
+        return None
+    hits = np.flatnonzero(distances_to(lat, lon, lats, lons) <= np.asarray(radii, dtype=float))
+    return int(hits[0]) if hits.size else None
+
+def is_within_radius(lat1, lon1, lat2, lon2, radius_meters=5):
+    return bool(distances_to(lat1, lon1, (lat2,), (lon2,))[0] <= radius_meters)
 
 def meter_to_degree_lat(meters: float) -> float:
     return meters / 111_000  # Breitengrad ≈ konstant
@@ -40,19 +59,128 @@ def create_buffered_area(points: list[dict], padding_m: float = 15.0):
 
     return buffered_area
 
+# Höchstens so viele Punkte pro Seite einer Distanzmatrix (1024² Float64 ≈ 8 MB je Zwischenergebnis)
+PAIR_BLOCK_SIZE = 1024
+
+def _within(lats_a, lons_a, lats_b, lons_b, max_distance_m):
+    """Boolesche Matrix: Haversine-Distanz <= max_distance_m (Broadcasting)."""
+    phi_a = np.radians(lats_a)[:, None]
+    phi_b = np.radians(lats_b)[None, :]
+    dlambda = np.radians(lons_b)[None, :] - np.radians(lons_a)[:, None]
+
+    a = np.sin((phi_b - phi_a) / 2)**2 + np.cos(phi_a) * np.cos(phi_b) * np.sin(dlambda / 2)**2
+    a = np.clip(a, 0.0, 1.0)
+    distance = 2 * EARTH_RADIUS_M * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return distance <= max_distance_m
+
+def _component_links(within, ids_a, ids_b):
+    """
+    Kanten (i, j), die dieselben Zusammenhangskomponenten ergeben wie alle Paare aus within,
+    aber höchstens eine pro Punkt: jeder Punkt wird mit dem kleinsten Punkt seiner Komponente
+    verbunden (Min-Label-Propagation). ids_a/ids_b: Punktindizes zu Zeilen/Spalten.
+    """
+    if not within.any():
+        return ids_a[:0], ids_b[:0]
+    rows = np.flatnonzero(within.any(axis=1))
+    cols = np.flatnonzero(within.any(axis=0))
+    within = within[np.ix_(rows, cols)]
+
+    # Labels: Zeilen 0..len(rows)-1, Spalten dahinter; jede Spalte hat mindestens einen
+    # Zeilennachbarn, das Minimum einer Komponente ist also immer eine Zeile
+    no_label = len(rows) + len(cols)
+    label_rows = np.arange(len(rows))
+    label_cols = np.arange(len(rows), no_label)
+    while True:
+        new_cols = np.minimum(label_cols, np.where(within, label_rows[:, None], no_label).min(axis=0))
+        new_rows = np.minimum(label_rows, np.where(within, new_cols[None, :], no_label).min(axis=1))
+        if np.array_equal(new_rows, label_rows) and np.array_equal(new_cols, label_cols):
+            break
+        label_rows, label_cols = new_rows, new_cols
+
+    roots = ids_a[rows]
+    return (
+        np.concatenate((roots, roots[label_cols])),
+        np.concatenate((roots[label_rows], ids_b[cols])),
+    )
+
 def cluster_points(points, max_distance_m=10):
-    clusters = []
+    """
+    Gruppiert Shapely-Punkte (x=lon, y=lat): zwei Punkte gehören zum selben Cluster,
+    wenn sie über eine Kette von Nachbarn mit Abstand <= max_distance_m verbunden sind.
 
-    for point in points:
-        added = False
-        for cluster in clusters:
-            if any(geodesic((point.y, point.x), (other.y, other.x)).meters <= max_distance_m for other in cluster):
-                cluster.append(point)
-                added = True
-                break
-        if not added:
-            clusters.append([point])
-    return clusters
+    Die Punkte werden einmal in eine lokale metrische Ebene projiziert und in ein Grid
+    mit Zellgröße max_distance_m einsortiert, so dass nur Nachbarzellen verglichen werden.
+    Die Cluster werden per Union-Find zusammengeführt und hängen daher nicht von der
+    Eingabereihenfolge ab. Ausgabe: Cluster in Reihenfolge ihres ersten Punkts.
+    """
+    n = len(points)
+    if n == 0:
+        return []
+
+    lats = np.fromiter((p.y for p in points), dtype=float, count=n)
+    lons = np.fromiter((p.x for p in points), dtype=float, count=n)
+
+    # Lokale equirektanguläre Projektion um den Mittelpunkt (Meter)
+    lat0 = float(lats.mean())
+    lon0 = float(lons.mean())
+    cos_lat0 = math.cos(math.radians(lat0))
+    y = EARTH_RADIUS_M * np.radians(lats - lat0)
+    x = EARTH_RADIUS_M * np.radians(lons - lon0) * cos_lat0
+
+    # Die Ost-West-Skalierung ist nur bei lat0 exakt, daher die Zellbreite so wählen,
+    # dass auch beim betragsmäßig größten Breitengrad kein Nachbar verloren geht
+    cos_min = max(math.cos(math.radians(float(np.abs(lats).max()))), 1e-6)
+    cell_x = max_distance_m * cos_lat0 / cos_min
+    cell_y = max_distance_m
+
+    cells = {}
+    for i, key in enumerate(zip(np.floor(x / cell_x).astype(np.int64).tolist(),
+                                np.floor(y / cell_y).astype(np.int64).tolist())):
+        cells.setdefault(key, []).append(i)
+    cells = {key: np.array(members) for key, members in cells.items()}
+
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(left, right):
+        for i, j in zip(left.tolist(), right.tolist()):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    # Halbe Nachbarschaft genügt, jedes Zellpaar wird so genau einmal verglichen
+    half_neighbourhood = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+    for (cx, cy), members in cells.items():
+        for dx, dy in half_neighbourhood:
+            other = cells.get((cx + dx, cy + dy))
+            if other is None:
+                continue
+            if len(members) * len(other) <= PAIR_BLOCK_SIZE:
+                rows, cols = np.nonzero(_within(lats[members], lons[members], lats[other], lons[other], max_distance_m))
+                union(members[rows], other[cols])
+                continue
+
+            # Dichte Zellen blockweise, damit weder Speicher noch Paaranzahl quadratisch wachsen
+            for start_a in range(0, len(members), PAIR_BLOCK_SIZE):
+                block_a = members[start_a:start_a + PAIR_BLOCK_SIZE]
+                for start_b in range(0, len(other), PAIR_BLOCK_SIZE):
+                    block_b = other[start_b:start_b + PAIR_BLOCK_SIZE]
+                    # Schon alle im selben Cluster: der Vergleich kann nichts mehr ändern
+                    if len({find(i) for i in block_a.tolist() + block_b.tolist()}) == 1:
+                        continue
+                    within = _within(lats[block_a], lons[block_a], lats[block_b], lons[block_b], max_distance_m)
+                    union(*_component_links(within, block_a, block_b))
+
+    clusters = {}
+    for i, point in enumerate(points):
+        clusters.setdefault(find(i), []).append(point)
+    return list(clusters.values())
 
 def cluster_points_by_distance(points, max_distance_m=20):
     clusters = []
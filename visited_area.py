@@ -0,0 +1,116 @@
+import os
+from datetime import datetime
+from sqlalchemy.orm import Session
+from db import SessionLocal
+import models as tables
+from shapely.ops import unary_union
+from geometry import build_visited_area, dump_geometry, feature_collection, geometry_from_feature_collection, load_geometry, polygon_parts, reapply_changes
+from geometry_service import geometry_service
+from tiles import tile_cache
+
+# So oft wird ein Rebuild an gleichzeitige Erweiterungen angepasst, bevor er aufgibt
+REBUILD_ATTEMPTS = int(os.getenv("REBUILD_ATTEMPTS", "3"))
+
+
+def record_wkb(record):
+    """Fläche eines VisitedPolygon als WKB oder None; alte Einträge ohne WKB werden aus dem GeoJSON konvertiert."""
+    if record and record.geometry_wkb:
+        return bytes(record.geometry_wkb)
+    if record and record.geojson:
+        legacy = geometry_from_feature_collection(record.geojson)
+        # Alte Features können sich überlappen; ohne Union wäre die Fläche ungültig und bliebe es bei jedem Merge
+        return dump_geometry(unary_union(polygon_parts(legacy))) if legacy is not None else None
+    return None
+
+
+def load_visited_wkb(db: Session, user_id: int):
+    """
+    Gibt (VisitedPolygon oder None, Fläche als WKB oder None) für den Geometrie-Service zurück.
+    Beendet die Lese-Transaktion, damit während der Berechnung keine Verbindung gehalten wird.
+    """
+    record = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
+    data = record_wkb(record)
+    db.commit()
+    return record, data
+
+
+def commit_visited_wkb(db: Session, user_id: int, record, data: bytes):
+    save_visited_wkb(db, user_id, record, data)
+    db.commit()
+
+
+def save_visited_wkb(db: Session, user_id: int, record, data: bytes):
+    """Speichert die Fläche als WKB; GeoJSON wird erst beim Lesen erzeugt. Committet nicht."""
+    if record is None:
+        record = tables.VisitedPolygon(user_id=user_id)
+        db.add(record)
+    record.geometry_wkb = data
+    record.geojson = None
+    record.last_updated = datetime.utcnow()
+    tile_cache.invalidate_user(user_id)
+    return record
+
+
+def visited_version(db: Session, user_id: int):
+    """last_updated der Fläche als String (lädt weder WKB noch GeoJSON), None wenn keine existiert."""
+    row = db.query(tables.VisitedPolygon.last_updated).filter_by(user_id=user_id).first()
+    if row is None:
+        return None
+    return row.last_updated.isoformat() if row.last_updated else ""
+
+
+def visited_geojson(record) -> dict:
+    if record.geometry_wkb:
+        return feature_collection(load_geometry(record.geometry_wkb))
+    return record.geojson or {"type": "FeatureCollection", "features": []}
+
+
+def rebuild_visited_area(user_id: int) -> dict:
+    """
+    Hintergrundjob: berechnet die Fläche eines Users komplett aus seinen Visited Zones neu.
+    Die DB-Verbindung wird während der Geometrieberechnung nicht gehalten. Wurde die Fläche
+    in der Zwischenzeit erweitert (last_updated geändert), wird das Hinzugekommene übernommen
+    statt überschrieben.
+    """
+    db = SessionLocal()
+    try:
+        record = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).first()
+        version = record.last_updated if record else None
+        before = record_wkb(record)
+        coords = [
+            (row.longitude, row.latitude)
+            for row in db.query(tables.VisitedZone.longitude, tables.VisitedZone.latitude).filter_by(user_id=user_id)
+        ]
+    finally:
+        db.close()
+
+    if not coords:
+        raise ValueError("Keine Visited Zones gefunden")
+
+    result = geometry_service.run_blocking(build_visited_area, coords)
+    vertices_before = result["vertices_before"]
+
+    for _ in range(REBUILD_ATTEMPTS):
+        db = SessionLocal()
+        try:
+            # Zeile sperren, damit zwischen Vergleich und Speichern keine Erweiterung dazwischenkommt
+            record = db.query(tables.VisitedPolygon).filter_by(user_id=user_id).with_for_update().first()
+            if record is None and version is not None:
+                raise ValueError("Fläche wurde während der Neuberechnung gelöscht")
+            if (record.last_updated if record else None) == version:
+                save_visited_wkb(db, user_id, record, result["wkb"])
+                db.commit()
+                return {
+                    "zones": len(coords),
+                    "vertices_before": vertices_before,
+                    "vertices_after": result["vertices_after"]
+                }
+            version = record.last_updated
+            current = record_wkb(record)
+        finally:
+            db.close()
+
+        result = geometry_service.run_blocking(reapply_changes, result["wkb"], before, current)
+        before = current
+
+    raise RuntimeError("Fläche wurde während der Neuberechnung zu oft geändert")